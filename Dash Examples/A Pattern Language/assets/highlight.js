@@ -0,0 +1,29 @@
+// Clientside highlighting for the main graph, used when the app runs with
+// CLIENTSIDE_HIGHLIGHT=1. The neighbor map and styles are shipped once in the
+// 'highlight-data' store, so selecting a pattern costs no server round trip.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    pattern_language: {
+        highlight: function(selectedNodeData, highlightData) {
+            if (!selectedNodeData || selectedNodeData.length === 0) {
+                return highlightData.default_stylesheet;
+            }
+            var styles = highlightData.styles;
+            var stylesheet = highlightData.base_stylesheet.slice();
+
+            selectedNodeData.forEach(function(node) {
+                var id = String(node.id);
+                stylesheet.push({selector: '[source = "' + id + '"]', style: styles.source});
+                stylesheet.push({selector: '[target = "' + id + '"]', style: styles.target});
+                (highlightData.neighbors[id] || []).forEach(function(neighbor) {
+                    stylesheet.push({selector: 'node[id = "' + neighbor + '"]', style: styles.neighbor});
+                });
+            });
+            // Selections made in the sub-graph don't select anything in the main graph,
+            // so mark the selected patterns by id instead of relying on ':selected'
+            selectedNodeData.forEach(function(node) {
+                stylesheet.push({selector: 'node[id = "' + node.id + '"]', style: styles.selected});
+            });
+            return stylesheet;
+        }
+    }
+});
@@ -0,0 +1,129 @@
+"""Benchmark the pattern language data pipeline on synthetic pattern sheets.
+
+    python bench_pattern_language.py --sizes 250 1000 10000 100000 --output bench.csv
+
+Each sheet has the same columns as the real workbook. Every step is timed
+(best of --repeat runs) and its peak Python memory measured with tracemalloc.
+The callbacks are simulated without a Dash server by calling the same helpers
+they use on a random selection of patterns."""
+import argparse
+import csv
+import random
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from pattern_graph import PatternIndex, GroupGraph, create_elements, create_sub_elements, make_graph_valid
+from pattern_layout import layout_elements
+from pattern_styles import main_stylesheet, subgraph_stylesheet
+
+
+def synthetic_pattern_sheet(n_rows, max_links=4, n_groups=36, seed=0):
+    """A pattern sheet shaped like the real one.
+
+    Patterns are ordered from large to small like the book, each one refers to
+    up to max_links bigger (lower id) patterns, and 'Smaller Patterns' holds the
+    reverse references. Cells follow the workbook's conventions: NaN when empty,
+    an int for a single reference and a comma separated string otherwise."""
+    rng = random.Random(seed)
+    bigger = {_id: [] for _id in range(1, n_rows + 1)}
+    smaller = {_id: [] for _id in range(1, n_rows + 1)}
+    for _id in range(2, n_rows + 1):
+        # Mostly link to nearby patterns, like neighbouring sections of the book
+        for target in {max(1, _id - 1 - int(rng.expovariate(1 / 20))) for _ in range(rng.randint(0, max_links))}:
+            bigger[_id].append(target)
+            smaller[target].append(_id)
+
+    def cell(ids):
+        if not ids:
+            return np.nan
+        if len(ids) == 1:
+            return ids[0]
+        return ', '.join(str(_id) for _id in sorted(ids))
+
+    return pd.DataFrame({
+        'id': range(1, n_rows + 1),
+        'Pattern Name': ['PATTERN {}'.format(_id) for _id in range(1, n_rows + 1)],
+        'Group': [1 + (_id - 1) * n_groups // n_rows for _id in range(1, n_rows + 1)],
+        'Bigger Patterns': [cell(bigger[_id]) for _id in range(1, n_rows + 1)],
+        'Smaller Patterns': [cell(smaller[_id]) for _id in range(1, n_rows + 1)],
+    })
+
+
+def measure(func, repeat):
+    """Best wall time over `repeat` runs and the peak traced memory of one run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def simulate_update_node_network(index, elements, list_of_ids):
+    stylesheet = main_stylesheet(index, list_of_ids)
+    selected = set(list_of_ids)
+    return stylesheet, [dict(elem, selected=int(elem['data']['id']) in selected) if 'id' in elem['data'] else elem
+                        for elem in elements]
+
+
+def simulate_update_subgraph(index, list_of_ids):
+    sub_nodes, sub_edges = create_sub_elements(index, list_of_ids)
+    layout_elements(sub_nodes, sub_edges)
+    return sub_nodes + sub_edges, subgraph_stylesheet(index, list_of_ids)
+
+
+def run(sizes, repeat=3, selection_size=3, layout_limit=20000, seed=0):
+    rows = []
+    rng = random.Random(seed)
+    for n_rows in sizes:
+        df = synthetic_pattern_sheet(n_rows, seed=seed)
+        index = PatternIndex(df)
+        nodes, edges = create_elements(index)
+        elements = nodes + edges
+        list_of_ids = rng.sample(index.ids, min(selection_size, n_rows))
+
+        steps = [
+            ('PatternIndex', lambda: PatternIndex(df)),
+            ('create_elements', lambda: create_elements(index)),
+            ('make_graph_valid', lambda: make_graph_valid(nodes + nodes, edges + edges, index)),
+            ('create_sub_elements', lambda: create_sub_elements(index, list_of_ids)),
+            ('GroupGraph', lambda: GroupGraph(index, nodes, edges)),
+            ('update_table', lambda: index.table_records(list_of_ids)),
+            ('update_node_network', lambda: simulate_update_node_network(index, elements, list_of_ids)),
+            ('update_subgraph', lambda: simulate_update_subgraph(index, list_of_ids)),
+        ]
+        # The full layout still takes seconds on large sheets, only run it up to layout_limit
+        if n_rows <= layout_limit:
+            steps.append(('layout_elements', lambda: layout_elements([dict(node) for node in nodes], edges)))
+
+        for name, func in steps:
+            seconds, peak, _ = measure(func, repeat)
+            rows.append({'rows': n_rows, 'edges': len(edges), 'step': name,
+                         'seconds': seconds, 'peak_bytes': peak})
+            print('{:>7} rows  {:<22} {:>10.2f} ms {:>10.1f} KiB'.format(n_rows, name, seconds * 1000, peak / 1024))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--selection-size', type=int, default=3)
+    parser.add_argument('--layout-limit', type=int, default=20000,
+                        help='largest sheet to run the full graph layout on')
+    parser.add_argument('--output', help='write the results to this CSV file')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.selection_size, args.layout_limit)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
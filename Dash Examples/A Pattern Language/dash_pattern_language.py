@@ -1,16 +1,16 @@
 import dash
-import dash_core_components as dcc
-import dash_html_components as html
-import dash_table
+from dash import dcc, html, dash_table
 
 import dash_cytoscape as cyto
-cyto.load_extra_layouts()
+# Layouts are precomputed (pattern_layout.py), the extra layout bundle isn't needed
 
 import plotly.express as px
 import pandas as pd
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash import Patch
 from dash.exceptions import PreventUpdate
 import json
+import os
 
 ###
 ## To Do:
@@ -20,81 +20,21 @@ import json
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
-from colour import Color
-red = Color("blue")
-colors = list(red.range_to(Color("green"),36))
-
-# Create color gradient for groups
-group_stylesheet = [{
-        "selector": '[group = {}]'.format(group+1),
-        'style': {
-            "opacity": .50,
-            'z-index': 9999,
-            'background-color': colors[group].hex
-        }
-} for group in range(36)]
-
-default_cyto_stylesheet = group_stylesheet + [
-    # Instantiate with the first node highlight white as a prompt
-    {
-        "selector": 'node[id = "1"]',
-        'style': {
-            "opacity": 1,
-            'z-index': 9999,
-            'background-color': 'white',
-            "border-width": 2,
-            "border-color": "black",
-            "border-opacity": 1
-        }
-    },
-    {
-        "selector": 'edge',
-        'style': {
-            "curve-style": "bezier",
-            "opacity": 0.15,
-            'z-index': 5000
-        }
-    },
-    # In the main graph, don't want to display names
-    {
-        'selector': ':selected',
-        "style": {
-            "border-width": 2,
-            "border-color": "black",
-            "border-opacity": 1,
-            "opacity": 1,
-            #"label": "data(label)",
-            "color": "black",
-            #"font-size": 12,
-            'z-index': 9999
-        }
-    }
-]
-
-
-default_cyto_subgraph_stylesheet = group_stylesheet + [
-    {
-        "selector": 'edge',
-        'style': {
-            "curve-style": "bezier",
-            "opacity": 0.15,
-            'z-index': 5000
-        }
-    },
-    {
-        'selector': ':selected',
-        "style": {
-            "border-width": 2,
-            "border-color": "black",
-            "border-opacity": 1,
-            "opacity": 1,
-            "label": "data(label)",
-            "color": "black",
-            "font-size": 12,
-            'z-index': 9999
-        }
-    }
-]
+from pattern_graph import selected_ids, make_node, create_sub_elements, create_neighborhood_elements
+from pattern_cache import load_dataset, LRUCache, STORE_DIR
+from pattern_store import open_graph_store
+from pattern_reload import DatasetReloader
+from pattern_layout import layout_elements
+from pattern_metrics import metrics, instrument, register_metrics_route, register_payload_sizes
+from pattern_styles import (default_cyto_stylesheet, default_cyto_subgraph_stylesheet,
+                            base_main_stylesheet, highlight_styles, main_stylesheet, subgraph_stylesheet)
+
+# Start the main graph with one node per group and expand groups on click (pattern_graph.GroupGraph)
+LEVEL_OF_DETAIL = os.environ.get('LEVEL_OF_DETAIL', '0') == '1'
+
+# Compute the main graph highlighting in the browser (assets/highlight.js) instead of on the server.
+# The level of detail view owns the main graph elements, so it always highlights in the browser.
+CLIENTSIDE_HIGHLIGHT = LEVEL_OF_DETAIL or os.environ.get('CLIENTSIDE_HIGHLIGHT', '0') == '1'
 
 
 
@@ -109,197 +49,75 @@ server = app.server
 ###
 ## Read in the data
 ###
-df = pd.read_excel('A Pattern Language.xlsx')
-
-###
-## Functions for making graphs
-###
-
-def create_edge_counts(row):
-    smallPs = row['Smaller Patterns']
-    if type(smallPs) == float:
-        smaller = 0
-    elif type(smallPs) == str:
-        smaller = len(smallPs.split(','))
-    else:
-        smaller = 1
 
-    bigPs = row['Bigger Patterns']
-    if type(bigPs) == float:
-        bigger = 0
-    elif type(bigPs) == str:
-        bigger = len(bigPs.split(','))
+def prepare_dataset(dataset):
+    """Add what every worker derives from a dataset before it goes live."""
+    index = dataset['index']
+
+    # Ids, names, groups, degrees and CSR adjacency as memory mapped arrays shared by all workers
+    graph_store = open_graph_store(index, os.environ.get('GRAPH_STORE', STORE_DIR), dataset.get('hash'))
+    index.attach_store(graph_store)
+
+    # One point per pattern, in row order, straight from the precomputed degree arrays
+    starter_fig2 = pd.DataFrame({'smaller': graph_store.smaller_degree, 'bigger': graph_store.bigger_degree,
+                                 'group': graph_store.groups, 'label': graph_store.names})
+    fig2 = px.scatter(starter_fig2, x="smaller", y="bigger", render_mode='webgl',
+                     color="group", hover_name="label", color_continuous_scale=['blue', 'green'])
+    # Selections only patch selectedpoints, these decide how selected and other points look
+    fig2.update_traces(selected={'marker': {'opacity': 1, 'size': 12}}, unselected={'marker': {'opacity': 0.15}})
+    # Keep zoom and pan when the figure is patched
+    fig2.update_layout(uirevision='selection')
+
+    return dict(dataset, graph_store=graph_store, figure=fig2,
+                # Node and edge list for master graph
+                elements=dataset['nodes'] + dataset['edges'],
+                neighbor_map=index.neighbor_map() if CLIENTSIDE_HIGHLIGHT else None)
+
+
+# Parsed frame, index, prebuilt elements, group view and search come from the binary cache,
+# the workbook is only parsed again when it has changed (see pattern_cache.py).
+# With RELOAD_INTERVAL set, the workbook is checked that often (in seconds) and changed rows
+# are patched in without a restart (see pattern_reload.py). Callbacks read reloader.current().
+reload_interval = os.environ.get('RELOAD_INTERVAL')
+reloader = DatasetReloader(load_dataset(), interval=float(reload_interval) if reload_interval else None,
+                           prepare=prepare_dataset)
+metrics.register_cache('reload', reloader)
+
+# Most patterns a search selects at once
+SEARCH_LIMIT = 10
+
+# Sub-graph elements and stylesheet per selection, popular patterns get clicked over and over.
+# Keys of both caches start with the dataset hash, entries of a replaced workbook just age out.
+subgraph_cache = LRUCache(maxsize=int(os.environ.get('SUBGRAPH_CACHE_SIZE', 256)),
+                          policy=os.environ.get('SUBGRAPH_CACHE_POLICY', 'lru'))
+metrics.register_cache('subgraph', subgraph_cache)
+
+# k-hop neighborhoods per (pattern, hops, direction), shared by every selection containing the pattern
+neighborhood_cache = LRUCache(maxsize=int(os.environ.get('NEIGHBORHOOD_CACHE_SIZE', 4096)))
+metrics.register_cache('neighborhood', neighborhood_cache)
+
+# Deepest neighborhood offered in the sub-graph
+MAX_HOPS = 5
+
+# Callback latency, payload size and cache stats as JSON
+register_payload_sizes(server)
+register_metrics_route(server)
+
+
+def build_subgraph(dataset, list_of_ids, hops=1, direction='both'):
+    index = dataset['index']
+    if hops == 1 and direction == 'both':
+        sub_nodes, sub_edges = create_sub_elements(index, list_of_ids)
     else:
-        bigger = 1
-
-    return smaller, bigger
-
-
-def create_node_names(df):
-    node_names = {}
-    for row in df[['id', 'Pattern Name']].iterrows():
-        row = row[1]
-        # Save the name for edge creation
-        _id = row.id
-        name = row['Pattern Name']
-        node_names[_id] = name
-    return node_names
-
-def create_elements(df, node_names):
-    # If center_on_ids, only make nodes for the center_on_ids and the associated edges
-    
-    
-    nodes = []
-    edges = []
-    
-    ### This is now inefficient placement because it is being called to populate the sub-graphs, should be at a level above
-
-    for row in df.iterrows():
-        # Extract row info from iterrows() tuple
-        row = row[1]
-        _id = int(row.id)
-        name = row['Pattern Name']
-        s, b = create_edge_counts(row)
-        # print(_id, name)
-        
-        # Add the node
-        node = {'data': {'id': _id, 'label': name, 'group': row.Group, 'smaller': s, 'bigger': b}}
-        nodes.append(node)
-        
-        # Add the edges, always upward only... this will miss some things... not add in reciprocal edges to keep graph cleaner
-        bigPs = row['Bigger Patterns']
-        if type(bigPs) == float:
-            bigger_nodes = []
-        elif type(bigPs) == str:
-            bigger_nodes = str(bigPs).split(',')
-        else:
-            bigger_nodes = [str(bigPs)]
-
-        for target in bigger_nodes:
-            #print(target)
-            target = int(target.strip())
-            try:
-                edge = {'data': {'source': _id, 'target': target, 
-                                 'label': '{big} -> {small}'.format(big=node_names[target], small=name),
-                                },
-                       'selectable': False}
-            except:
-                print('Problem with node', node)
-                print('Node names', node_names)
-            edges.append(edge)
-            
-        smallPs = row['Smaller Patterns']
-        if type(smallPs) == float:
-            smaller_nodes = []
-        elif type(smallPs) == str:
-            smaller_nodes = str(smallPs).split(',')
-        else:
-            smaller_nodes = [str(smallPs)]
-
-        for source in smaller_nodes:
-            #print(target)
-            source = int(source.strip())
-            try:
-                edge = {'data': {'source': source, 'target': _id, 
-                                 'label': '{big} -> {small}'.format(big=name, small=node_names[source]),
-                                },
-                       'selectable': False}
-            except:
-                print('Problem with node', node)
-                print('Node names', node_names)
-            edges.append(edge)
-    
-    nodes, edges = make_graph_valid(nodes, edges)
-    
-    return nodes, edges
-
-def dedupe_items(nodes):
-    seen = []
-    for node in nodes:
-        if node not in seen:
-            yield node
-            seen.append(node)
-
-
-def create_sub_elements(df, list_of_ids, node_names):
-    
-    nodes = []
-    edges = []
-    
-    for item_id in list_of_ids:
-        print('Processing', item_id)
-        print()
-        item = df.iloc[item_id-1]
-        print('Item info', item)
-        print()
-        
-        sub_df = df[df['id'] == item_id]
-    
-        add_nodes, add_edges = create_elements(sub_df, node_names)
-        
-        nodes += add_nodes
-        edges += add_edges
-        
-        print()
-        print(nodes + edges)
-        print()
-
-    # dedupe_items returns a generator, https://stackoverflow.com/questions/33955225/remove-duplicate-json-objects-from-list-in-python
-    nodes, edges = make_graph_valid(nodes, edges)
-    
-    return nodes, edges
-    
-def make_node(node_id):
-    node_id = int(node_id)
-    node_info = df.iloc[node_id-1]
-    print(node_info)
-    name = node_info['Pattern Name']
-    group = node_info['Group']
-    node = {'data': {'id': node_id, 'label': name, 'group': group}}
-    return [node]
-
-def make_graph_valid(nodes, edges):
-    for edge in edges:
-        #print(edge)
-        target = int(edge['data']['target'])
-        source = int(edge['data']['source'])
-        
-        if not any([int(node['data']['id']) == target for node in nodes]):
-            new_node = make_node(target)
-            #print('new node', new_node)
-            nodes += new_node
-        #print(nodes)
-        #for node in nodes:
-        #    print(node)
-        #    print(int(node['data']['id']) == source)
-            
-        if not any([int(node['data']['id']) == source for node in nodes]):
-            nodes += make_node(source)
-            
-    nodes = list(dedupe_items(nodes))
-    edges = list(dedupe_items(edges))
-    
-    return nodes, edges
-   
-
-####
-## Use functions above to instantiate graphs
-####
-
-# Create
-node_names = create_node_names(df)
-
-# Create node and edge list for master graph
-nodes, edges = create_elements(df, node_names)
-elements = nodes + edges
-
-# Instantiate sub-graph
-sub_nodes, sub_edges = create_sub_elements(df, [1], node_names)
-valid_sub_nodes, valid_sub_edges = make_graph_valid(sub_nodes, sub_edges)
-
-default_sub_elements = valid_sub_nodes + valid_sub_edges
-#print(edges)
-#print(nodes)
+        # Everything within `hops` of any selected pattern, and the edges between them
+        neighborhood = set()
+        for _id in list_of_ids:
+            neighborhood.update(neighborhood_cache.get_or_compute(
+                (dataset['hash'], _id, hops, direction), lambda: index.k_hop(_id, hops, direction)))
+        sub_nodes, sub_edges = create_neighborhood_elements(index, sorted(neighborhood))
+    # Lay the sub-graph out here, the cache keeps the positions for the next time it is selected
+    layout_elements(sub_nodes, sub_edges)
+    return sub_nodes + sub_edges, subgraph_stylesheet(index, list_of_ids)
 
 
 
@@ -308,8 +126,6 @@ default_sub_elements = valid_sub_nodes + valid_sub_edges
 
 ###
 ## TO DO
-## Make scatter plot interact with the selections in the cytoscape network and the bar chart
-## Have selections in network and the neighbors control the opacity of points in the scatterplot
 ## Fix axes on the "connections" bar chart so that it stays relative to the most connected concepts
 ###
 
@@ -323,65 +139,104 @@ default_sub_elements = valid_sub_nodes + valid_sub_edges
 #fig1 = px.bar(starter_fig1, x='Type of connection', y='Count')
 
 
-starter_fig2 = pd.DataFrame([node['data'] for node in nodes])
-starter_fig2['id'] = starter_fig2.index
-fig2 = px.scatter(starter_fig2, x="smaller", y="bigger",
-                 color="group", hover_name="label", color_continuous_scale=['blue', 'green'])
-
-app.layout = html.Div(children=[
-    html.H1(children='Explore a Pattern Language of Cities, Towns, and Landscapes!'),
-    html.H4(children='The spaces we live in are poems written in this "Pattern Language".'),
-    html.H6(children='Click on a circle below - each represents a design pattern. The lines show how patterns relate to each other.'),
+def serve_layout():
+    # Built per page load so a reloaded workbook shows up on refresh
+    dataset = reloader.current()
+    index = dataset['index']
+    return html.Div(children=[
+        html.H1(children='Explore a Pattern Language of Cities, Towns, and Landscapes!'),
+        html.H4(children='The spaces we live in are poems written in this "Pattern Language".'),
+        html.H6(children='Click on a circle below - each represents a design pattern. The lines show how patterns relate to each other.'),
+
+        dcc.Input(
+            id='pattern-search',
+            type='text',
+            placeholder='Search patterns...',
+            style={'width': '100%'}
+        ),
     
 
-    html.Div([
-             cyto.Cytoscape(
-                id='cytoscape-layout',
-                elements=elements,
-                style={'width': '100%', 'height': '300px'},
-                stylesheet = default_cyto_stylesheet,
-                minZoom = .5,
-                maxZoom = 1,
-                layout={
-                    'name': 'grid' #cola
-                }
-             )
-    ]),
+        html.Div([
+                 cyto.Cytoscape(
+                    id='cytoscape-layout',
+                    elements=dataset['group_graph'].elements() if LEVEL_OF_DETAIL else dataset['elements'],
+                    style={'width': '100%', 'height': '300px'},
+                    stylesheet = default_cyto_stylesheet,
+                    minZoom = .5,
+                    maxZoom = 1,
+                    layout={
+                        'name': 'preset' # positions are precomputed server-side, see pattern_layout.py
+                    }
+                 )
+        ]),
     
-    dash_table.DataTable(
-        id='selected-nodes-table',
-        columns= [{'id': c, 'name': c} for c in df.columns],
-        data=[],
-        style_cell={
-        'whiteSpace': 'normal',
-        'height': 'auto',
-        }
-    ),
-    html.Div([
-        # the children of this Div will be set to a cytoscape sub-graph of the selected node's elements
-        html.Div(children=[cyto.Cytoscape(
-                id='sub-graph-graph',
-                elements=default_sub_elements,
-                style={'width': '100%', 'height': '300px'},
-                stylesheet = default_cyto_subgraph_stylesheet,
-                minZoom = .5,
-                maxZoom = 1,
-                layout={
-                    'name': 'cola' #use a force directed algorithm to get space for labels on the sub-graph
-                }
-             )],
-                id='sub-graph-div',
-                style={'width': '48%', 'display':'inline-block'}
+        dash_table.DataTable(
+            id='selected-nodes-table',
+            columns= [{'id': c, 'name': c} for c in index.columns],
+            data=[],
+            style_cell={
+            'whiteSpace': 'normal',
+            'height': 'auto',
+            }
         ),
-        html.Div([dcc.Graph(
-                id='selection-relative-to-rest',
-                figure = fig2)],
-             style={'width': '48%', 'display':'inline-block', 'align':'right'},
+        html.Div([
+            html.Label('Sub-graph depth'),
+            dcc.Slider(
+                id='neighborhood-hops',
+                min=1, max=MAX_HOPS, step=1, value=1,
+                marks={hops: str(hops) for hops in range(1, MAX_HOPS + 1)}
+            ),
+            dcc.RadioItems(
+                id='neighborhood-direction',
+                options=[{'label': 'Bigger patterns', 'value': 'up'},
+                         {'label': 'Smaller patterns', 'value': 'down'},
+                         {'label': 'Both', 'value': 'both'}],
+                value='both',
+                labelStyle={'display': 'inline-block'}
+            )
+        ], style={'width': '48%'}),
+        html.Div([
+            # the children of this Div will be set to a cytoscape sub-graph of the selected node's elements
+            html.Div(children=[cyto.Cytoscape(
+                    id='sub-graph-graph',
+                    elements=dataset['default_sub_elements'],
+                    style={'width': '100%', 'height': '300px'},
+                    stylesheet = default_cyto_subgraph_stylesheet,
+                    minZoom = .5,
+                    maxZoom = 1,
+                    layout={
+                        'name': 'preset' # force directed positions computed server-side to get space for labels
+                    }
+                 )],
+                    id='sub-graph-div',
+                    style={'width': '48%', 'display':'inline-block'}
+            ),
+            html.Div([dcc.Graph(
+                    id='selection-relative-to-rest',
+                    figure = dataset['figure'])],
+                 style={'width': '48%', 'display':'inline-block', 'align':'right'},
+            )
+        ]),
+
+        # Groups currently opened up in the level of detail view
+        dcc.Store(id='expanded-groups', data=[]),
+
+        # Everything the browser needs to highlight selections by itself, sent once with the layout
+        dcc.Store(
+            id='highlight-data',
+            data={
+                'neighbors': dataset['neighbor_map'],
+                'styles': highlight_styles,
+                'base_stylesheet': base_main_stylesheet,
+                'default_stylesheet': default_cyto_stylesheet,
+            } if CLIENTSIDE_HIGHLIGHT else None
         )
-    ])
     
     
-])
+    ])
+
+
+app.layout = serve_layout
 
 
 ##### CALLBACKS #####
@@ -392,237 +247,87 @@ app.layout = html.Div(children=[
     Output(component_id='selected-nodes-table', component_property='data'),
     [Input(component_id='cytoscape-layout', component_property='selectedNodeData')]
 )
+@instrument('update_table')
 def update_table(selectedNodeData):
-    data = []
     if not selectedNodeData:
         return []
-    for node in selectedNodeData:
-        dff = df.loc[df['id'] == int(node['id'])]
-        data.append(dff.to_dict('records')[0])
-
-    # The bigger and smaller patterns are given in terms of IDs, translate this to the labels!
-    for node in data:
-        #print(node)
-        #print('Type of bigger patterns',type(node['Bigger Patterns']))
-        if type(node['Bigger Patterns']) == float:
-            big_patterns = ''
-        else:
-            big_patterns = [int(pat) for pat in str(node['Bigger Patterns']).split(',')]
-
+    index = reloader.current()['index']
+    # The bigger and smaller patterns are given in terms of IDs, the index translates them to the labels
+    return index.table_records(selected_ids(selectedNodeData, index))
 
-        new_big_patterns = ', '.join([list(df.loc[df['id'] == bigP, 'Pattern Name'].values)[0].strip() for bigP in big_patterns])
 
-        if type(node['Smaller Patterns']) == float:
-            small_patterns = ''
-        else:
-            small_patterns = [int(pat) for pat in str(node['Smaller Patterns']).split(',')]
-        new_small_patterns = ', '.join([list(df.loc[df['id'] == smallP, 'Pattern Name'].values)[0].strip() for smallP in small_patterns])
 
 
-        node['Bigger Patterns'] = new_big_patterns
-        node['Smaller Patterns'] = new_small_patterns
-      
-    #print(data)
-    return data
 
-
-
-
-
-@app.callback(
-    [Output(component_id='cytoscape-layout', component_property='stylesheet'),
-     Output(component_id='cytoscape-layout', component_property='elements')],
-    [Input(component_id='cytoscape-layout', component_property='selectedNodeData')]
-)
 def update_node_network(selectedNodeData):
+    dataset = reloader.current()
+    index, elements = dataset['index'], dataset['elements']
     if not selectedNodeData:
-        return default_cyto_stylesheet
-    
-    new_stylesheet = group_stylesheet + [
-        {
-            "selector": 'edge',
-            'style': {
-                "curve-style": "bezier",
-                "opacity": 0.15,
-                'z-index': 5000
-            }
-        },
-        {
-            # Add the name of the selected item, not the bigger and smaller patterns
-            'selector': ':selected',
-            "style": {
-                "border-width": 2,
-                "border-color": "black",
-                "border-opacity": 1,
-                "opacity": 1,
-                "label": "data(label)",
-                "color": "black",
-                "font-size": 17,
-                'z-index': 9999,
-            }
-        }
-    ]
-    
-    for node in selectedNodeData:
-        
-        new_stylesheet.append({
-                    "selector": '[source = "{}"]'.format(node['id']),
-                    "style": {
-                        "line-color": "blue",
-                        'opacity': 0.9,
-                        'z-index': 9999
-                    }
-                })
-        new_stylesheet.append({
-                    "selector": '[target = "{}"]'.format(node['id']),
-                    "style": {
-                        "line-color": "green",
-                        'opacity': 0.9,
-                        'z-index': 9999
-                    }
-                })
-        
-
-        bigPs = df.loc[df['id'] == int(node['id']), 'Bigger Patterns'].values[0]
-        print('bigPs', bigPs)
-        if type(bigPs) == float:
-            pass
-        else:
-            bigPs = str(bigPs).split(',')
-            for _id in bigPs:
-                new_stylesheet.append({
-                    "selector": 'node[id = "{}"]'.format(_id),
-                    "style": {
-                        #"label": "data(label)",
-                        "border-width": 2,
-                        "border-color": "black",
-                        "border-opacity": 1,
-                        "opacity": 1,
-                        'opacity': 0.9,
-                        'z-index': 9999
-                    }
-                })
-
-
-        smallPs = df.loc[df['id'] == int(node['id']), 'Smaller Patterns'].values[0]
-        #print('smallPs', smallPs)
-        if type(smallPs) == float:
-            pass
-        else:
-            smallPs = str(smallPs).split(',')
-            for _id in smallPs:
-                new_stylesheet.append({
-                    "selector": 'node[id = "{}"]'.format(_id),
-                    "style": {
-                        #"label": "data(label)",
-                        "border-width": 2,
-                        "border-color": "black",
-                        "border-opacity": 1,
-                        "opacity": 1,
-                        'opacity': 0.9,
-                        'z-index': 9999
-                    }
-                })
-       
-    selected_ids = [int(node['id']) for node in selectedNodeData]
-    for elem in elements:
-        # if ID present is a node
-        if 'id' in elem['data']:
-            if int(elem['data']['id']) in selected_ids: 
-                elem['selected'] = True
-            else:
-                elem['selected'] = False
-    return new_stylesheet, elements
+        return default_cyto_stylesheet, elements
+
+    list_of_ids = selected_ids(selectedNodeData, index)
+    new_stylesheet = main_stylesheet(index, list_of_ids)
+
+    # Toggle the selected flags on copies, elements is shared between concurrent requests
+    selected = set(list_of_ids)
+    new_elements = [dict(elem, selected=int(elem['data']['id']) in selected) if 'id' in elem['data'] else elem
+                    for elem in elements]
+    return new_stylesheet, new_elements
+
+
+if CLIENTSIDE_HIGHLIGHT:
+    # Only the stylesheet changes and it is computed in the browser, the server does nothing per click
+    app.clientside_callback(
+        ClientsideFunction(namespace='pattern_language', function_name='highlight'),
+        Output(component_id='cytoscape-layout', component_property='stylesheet'),
+        [Input(component_id='cytoscape-layout', component_property='selectedNodeData')],
+        [State(component_id='highlight-data', component_property='data')]
+    )
+else:
+    app.callback(
+        [Output(component_id='cytoscape-layout', component_property='stylesheet'),
+         Output(component_id='cytoscape-layout', component_property='elements')],
+        [Input(component_id='cytoscape-layout', component_property='selectedNodeData')]
+    )(instrument('update_node_network')(update_node_network))
         
     
     
     
     
+def expand_group(tapNodeData, expanded):
+    # Clicking a group opens it up into its patterns, clicking it again collapses it
+    if not tapNodeData or tapNodeData.get('kind') != 'group':
+        raise PreventUpdate
+    expanded = set(expanded or []) ^ {tapNodeData['group']}
+    return reloader.current()['group_graph'].elements(expanded), sorted(expanded)
+
+
+if LEVEL_OF_DETAIL:
+    app.callback(
+        [Output(component_id='cytoscape-layout', component_property='elements'),
+         Output(component_id='expanded-groups', component_property='data')],
+        [Input(component_id='cytoscape-layout', component_property='tapNodeData')],
+        [State(component_id='expanded-groups', component_property='data')]
+    )(instrument('expand_group')(expand_group))
+
+
 @app.callback(
     Output(component_id='sub-graph-div', component_property='children'),
-    [Input(component_id='cytoscape-layout', component_property='selectedNodeData')]
+    [Input(component_id='cytoscape-layout', component_property='selectedNodeData'),
+     Input(component_id='neighborhood-hops', component_property='value'),
+     Input(component_id='neighborhood-direction', component_property='value')]
 )
-def update_subgraph(selectedNodeData):
-    print('selectedNodeData for updating sub-graph', selectedNodeData)
-    if selectedNodeData:
-        list_of_ids = [int(node['id']) for node in selectedNodeData]
-        sub_nodes, sub_edges = create_sub_elements(df, list_of_ids, node_names)
-        valid_sub_nodes, valid_sub_edges = make_graph_valid(sub_nodes, sub_edges)
-
-        sub_elements = valid_sub_nodes + valid_sub_edges
-        
-        cyto_subgraph_stylesheet = group_stylesheet + []
-    
-        for node in selectedNodeData:
-            cyto_subgraph_stylesheet.append({
-                        "selector": '[source = "{}"]'.format(node['id']),
-                        "style": {
-                            "line-color": "blue",
-                            'opacity': 0.9,
-                            'z-index': 9999
-                        }
-                    })
-            cyto_subgraph_stylesheet.append({
-                        "selector": '[target = "{}"]'.format(node['id']),
-                        "style": {
-                            "line-color": "green",
-                            'opacity': 0.9,
-                            'z-index': 9999
-                        }
-                    })
-            cyto_subgraph_stylesheet.append({
-                        "selector": 'node[id = "{}"]'.format(node['id']),
-                        "style": {
-                            "label": "data(label)",
-                            "border-width": 2,
-                            "border-color": "black",
-                            "border-opacity": 1,
-                            'opacity': 1,
-                            'z-index': 9999
-                        }
-                    })
-
-
-            bigPs = df.loc[df['id'] == int(node['id']), 'Bigger Patterns'].values[0]
-            print('bigPs', bigPs)
-            if type(bigPs) == float:
-                pass
-            else:
-                bigPs = str(bigPs).split(',')
-                for _id in bigPs:
-                    cyto_subgraph_stylesheet.append({
-                        "selector": 'node[id = "{}"]'.format(_id),
-                        "style": {
-                            "label": "data(label)",
-                            #"border-width": 2,
-                            #"border-color": "black",
-                            #"border-opacity": 1,
-                            'opacity': 0.9,
-                            'z-index': 9999
-                        }
-                    })
-
-
-            smallPs = df.loc[df['id'] == int(node['id']), 'Smaller Patterns'].values[0]
-            #print('smallPs', smallPs)
-            if type(smallPs) == float:
-                pass
-            else:
-                smallPs = str(smallPs).split(',')
-                for _id in smallPs:
-                    cyto_subgraph_stylesheet.append({
-                        "selector": 'node[id = "{}"]'.format(_id),
-                        "style": {
-                            "label": "data(label)",
-                            #"border-width": 2,
-                            #"border-color": "black",
-                            #"border-opacity": 1,
-                            'opacity': 0.9,
-                            'z-index': 9999
-                        }
-                    })
+@instrument('update_subgraph')
+def update_subgraph(selectedNodeData, hops=1, direction='both'):
+    dataset = reloader.current()
+    # Keyed on the set of ids, the selection order doesn't change the sub-graph
+    ids = frozenset(selected_ids(selectedNodeData, dataset['index']))
+    if ids:
+        hops = min(max(int(hops or 1), 1), MAX_HOPS)
+        sub_elements, cyto_subgraph_stylesheet = subgraph_cache.get_or_compute(
+            (dataset['hash'], ids, hops, direction), lambda: build_subgraph(dataset, sorted(ids), hops, direction))
     else:
-        sub_elements = default_sub_elements
+        sub_elements = dataset['default_sub_elements']
         cyto_subgraph_stylesheet = default_cyto_subgraph_stylesheet
         
     
@@ -634,24 +339,55 @@ def update_subgraph(selectedNodeData):
                     minZoom = .5,
                     maxZoom = 1,
                     layout={
-                        'name': 'cola' #use a force directed algorithm to get space for labels on the sub-graph
+                        'name': 'preset' # force directed positions computed server-side to get space for labels
                     }
                  )
     return subgraph
 
     
+@app.callback(
+    Output(component_id='selection-relative-to-rest', component_property='figure'),
+    [Input(component_id='cytoscape-layout', component_property='selectedNodeData')]
+)
+@instrument('update_scatter')
+def update_scatter(selectedNodeData):
+    # Only the indices of the highlighted points are sent, never the whole figure
+    patched_figure = Patch()
+    index = reloader.current()['index']
+    list_of_ids = selected_ids(selectedNodeData, index)
+    if not list_of_ids:
+        patched_figure['data'][0]['selectedpoints'] = None
+        return patched_figure
+
+    highlighted = set(list_of_ids)
+    for _id in list_of_ids:
+        highlighted.update(index.neighbors(_id))
+    patched_figure['data'][0]['selectedpoints'] = sorted(index.row[_id] for _id in highlighted if _id in index)
+    return patched_figure
+
+
 @app.callback(
     Output(component_id='cytoscape-layout', component_property='selectedNodeData'),
-    [Input(component_id='sub-graph-graph', component_property='selectedNodeData')]
+    [Input(component_id='sub-graph-graph', component_property='selectedNodeData'),
+     Input(component_id='pattern-search', component_property='value')]
 )
-def link_subgraph_to_main(selectedNodeData):
+@instrument('link_subgraph_to_main')
+def link_subgraph_to_main(selectedNodeData, search_query=None):
+    # A selection can only have one callback writing it, so the search box shares this one
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    if 'pattern-search.value' in triggered:
+        dataset = reloader.current()
+        matches = dataset['search'].search(search_query or '', limit=SEARCH_LIMIT)
+        if not matches:
+            raise PreventUpdate
+        return [make_node(dataset['index'], _id)['data'] for _id in matches]
+
     if selectedNodeData:
         return selectedNodeData
     else:
-        print('Prevented!')
         raise PreventUpdate
     
     
 if __name__ == '__main__':
-    app.run_server(debug=True, threaded=True)
+    app.run(debug=True, threaded=True)
     
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from pattern_graph import PatternIndex, GroupGraph, create_elements, create_sub_elements
+from pattern_layout import layout_elements
+from pattern_search import PatternSearch
+
+###
+## Binary cache of the parsed workbook and the prebuilt Cytoscape elements
+##
+## Parsing the workbook through xlrd and rebuilding the elements is most of the
+## start up time of a worker. Run `python pattern_cache.py` to write the cache
+## ahead of time, workers then unpickle it and only fall back to Excel when the
+## workbook no longer matches the hash stored in the cache.
+###
+
+DATA_FILE = 'A Pattern Language.xlsx'
+CACHE_FILE = 'A Pattern Language.pkl'
+STORE_DIR = 'A Pattern Language.store'
+
+# Bump when the layout of the cached dataset changes
+CACHE_VERSION = 6
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def build_dataset(df, data_hash=None):
+    """Everything the app computes from the sheet before it can serve a request."""
+    index = PatternIndex(df)
+    nodes, edges = create_elements(index)
+    sub_nodes, sub_edges = create_sub_elements(index, [1])
+    # Positions are computed once here so both graphs can use the 'preset' layout
+    layout_elements(nodes, edges)
+    layout_elements(sub_nodes, sub_edges)
+    return {
+        'hash': data_hash,
+        'df': df,
+        'index': index,
+        'nodes': nodes,
+        'edges': edges,
+        'default_sub_elements': sub_nodes + sub_edges,
+        'group_graph': GroupGraph(index, nodes, edges),
+        'search': PatternSearch(index),
+    }
+
+
+def write_cache(dataset, data_hash, cache_file=CACHE_FILE):
+    payload = {'version': CACHE_VERSION, 'hash': data_hash, 'dataset': dataset}
+
+    # Write to a temporary file first so a worker never sees a half written cache
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+
+def build_cache(data_file=DATA_FILE, cache_file=CACHE_FILE):
+    """Parse the workbook and write the dataset to cache_file. Returns the dataset."""
+    data_hash = file_hash(data_file)
+    dataset = build_dataset(pd.read_excel(data_file), data_hash)
+    write_cache(dataset, data_hash, cache_file)
+    return dataset
+
+
+def read_cache(cache_file=CACHE_FILE):
+    try:
+        with open(cache_file, 'rb') as f:
+            payload = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if payload.get('version') != CACHE_VERSION:
+        return None
+    return payload
+
+
+def load_dataset(data_file=DATA_FILE, cache_file=CACHE_FILE):
+    """Load the dataset from cache_file, rebuilding it when the workbook has changed.
+
+    If only the cache is deployed (no workbook next to it), the cache is trusted as is."""
+    payload = read_cache(cache_file)
+    if not os.path.exists(data_file):
+        if payload is None:
+            raise FileNotFoundError(data_file)
+        return payload['dataset']
+
+    data_hash = file_hash(data_file)
+    if payload is not None and payload['hash'] == data_hash:
+        return payload['dataset']
+
+    dataset = build_dataset(pd.read_excel(data_file), data_hash)
+    try:
+        write_cache(dataset, data_hash, cache_file)
+    except OSError:
+        # Read only file system, serve from the freshly parsed workbook anyway
+        pass
+    return dataset
+
+
+###
+## In memory cache for per-selection results
+###
+
+class LRUCache:
+    """Bounded, thread safe mapping that counts hits and misses.
+
+    policy='lru' evicts the least recently used entry once maxsize is reached,
+    policy='fifo' evicts the oldest insert regardless of use. maxsize=0 disables
+    caching, maxsize=None never evicts."""
+
+    def __init__(self, maxsize=256, policy='lru'):
+        if policy not in ('lru', 'fifo'):
+            raise ValueError('Unknown eviction policy {!r}'.format(policy))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, calling compute() on a miss."""
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                if self.policy == 'lru':
+                    self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+
+        # Compute outside the lock so a slow miss doesn't block other selections
+        value = compute()
+        if self.maxsize == 0:
+            return value
+
+        with self._lock:
+            self._data[key] = value
+            while self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._data), 'maxsize': self.maxsize}
+
+
+if __name__ == '__main__':
+    from pattern_store import write_graph_store
+
+    dataset = build_cache()
+    write_graph_store(dataset['index'], STORE_DIR, dataset['hash'])
+    print('Cached {} patterns to {} and {}'.format(len(dataset['index']), CACHE_FILE, STORE_DIR))
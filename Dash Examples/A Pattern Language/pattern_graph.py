@@ -0,0 +1,417 @@
+import copy
+import math
+
+import numpy as np
+
+###
+## Lookups over the pattern sheet, built once at startup and shared by every callback
+###
+
+# Group of the rows with an empty 'Group' cell, a number so groups still sort and color
+UNGROUPED = 0
+
+
+def parse_group(value):
+    """Turn a 'Group' cell into a group key, UNGROUPED for empty cells.
+
+    A single empty cell makes pandas read the whole column as floats, whole
+    numbers are turned back into ints so labels and keys stay the same."""
+    if value is None or value != value:  # empty / NaN cell
+        return UNGROUPED
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def parse_pattern_ids(value):
+    """Turn a 'Bigger Patterns' / 'Smaller Patterns' cell into a list of integer ids.
+
+    Empty cells come back from pandas as NaN, single references as a number and
+    multiple references as a comma separated string."""
+    if value is None:
+        return []
+    if isinstance(value, float):
+        return [] if math.isnan(value) else [int(value)]
+    if isinstance(value, str):
+        return [int(part) for part in value.split(',') if part.strip()]
+    return [int(value)]
+
+
+def csr_adjacency(row, ids, adjacency):
+    """(indptr, indices) arrays over row positions for an {id: [neighbor ids]} mapping.
+
+    Neighbors that are not in the sheet are left out."""
+    lists = [[row[other] for other in adjacency[_id] if other in row] for _id in ids]
+    indptr = np.zeros(len(ids) + 1, dtype=np.int32)
+    np.cumsum([len(neighbors) for neighbors in lists], out=indptr[1:])
+    indices = np.fromiter((pos for neighbors in lists for pos in neighbors), dtype=np.int32, count=indptr[-1])
+    return indptr, indices
+
+
+def expand_frontier(indptr, indices, frontier):
+    """All CSR neighbors of the rows in frontier, gathered without a Python loop."""
+    starts = indptr[frontier]
+    lengths = indptr[frontier + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=indices.dtype)
+    # Offset of every gathered entry: its row start plus its position within the row
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return indices[offsets]
+
+
+class PatternIndex:
+    """Precomputed id -> name / row / group / neighbor lookups for the pattern sheet.
+
+    Callbacks use this instead of scanning df['id'] and re-splitting the
+    'Bigger Patterns' / 'Smaller Patterns' strings on every click, so the cost of
+    a callback depends on the size of the selection, not the size of the sheet."""
+
+    def __init__(self, df):
+        self.df = df
+        self.columns = list(df.columns)
+        self.ids = [int(_id) for _id in df['id'].tolist()]
+        self.row = {_id: pos for pos, _id in enumerate(self.ids)}
+        self.names = dict(zip(self.ids, df['Pattern Name'].tolist()))
+        self.groups = dict(zip(self.ids, map(parse_group, df['Group'].tolist())))
+        self.bigger = dict(zip(self.ids, map(parse_pattern_ids, df['Bigger Patterns'].tolist())))
+        self.smaller = dict(zip(self.ids, map(parse_pattern_ids, df['Smaller Patterns'].tolist())))
+        self.records = dict(zip(self.ids, df.to_dict('records')))
+
+        # Which rows mention an id in their bigger / smaller cells, even ids missing from the sheet
+        self.references = {}
+        for _id in self.ids:
+            for other in self.bigger[_id] + self.smaller[_id]:
+                self.references.setdefault(other, set()).add(_id)
+
+        self.build_adjacency()
+
+    def build_adjacency(self):
+        # CSR adjacency over row positions, 'up' follows bigger patterns and 'down' smaller ones
+        self.adjacency = {'up': csr_adjacency(self.row, self.ids, self.bigger),
+                          'down': csr_adjacency(self.row, self.ids, self.smaller)}
+        self.store = None
+
+    def updated(self, df, records, changed):
+        """A new index for df that reparses only the rows of the changed ids.
+
+        records is df.to_dict('records') keyed on id, changed the ids that were
+        added, removed or edited. Everything else is shared with this index,
+        which is left untouched for requests still using it."""
+        new = copy.copy(self)
+        new.df = df
+        new.columns = list(df.columns)
+        new.ids = [int(_id) for _id in df['id'].tolist()]
+        new.row = {_id: pos for pos, _id in enumerate(new.ids)}
+        new.records = records
+        new.names, new.groups = dict(self.names), dict(self.groups)
+        new.bigger, new.smaller = dict(self.bigger), dict(self.smaller)
+        new.references = dict(self.references)
+
+        for _id in changed:
+            if _id in self.row:
+                for other in self.bigger[_id] + self.smaller[_id]:
+                    new.references[other] = new.references[other] - {_id}
+                    if not new.references[other]:
+                        del new.references[other]
+            if _id in records:
+                record = records[_id]
+                new.names[_id], new.groups[_id] = record['Pattern Name'], parse_group(record['Group'])
+                new.bigger[_id] = parse_pattern_ids(record['Bigger Patterns'])
+                new.smaller[_id] = parse_pattern_ids(record['Smaller Patterns'])
+                for other in new.bigger[_id] + new.smaller[_id]:
+                    new.references[other] = new.references.get(other, set()) | {_id}
+            else:
+                for lookup in (new.names, new.groups, new.bigger, new.smaller):
+                    lookup.pop(_id, None)
+
+        new.build_adjacency()
+        return new
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, _id):
+        return _id in self.row
+
+    def attach_store(self, store):
+        """Use the memory mapped CSR adjacency of a pattern_store.GraphStore instead of
+        this index's own copy, so workers share it. The id lookups stay per process."""
+        self.adjacency = store.adjacency
+        self.store = store
+
+    def neighbors(self, _id):
+        """Bigger patterns followed by smaller patterns of a single pattern."""
+        return self.bigger[_id] + self.smaller[_id]
+
+    def k_hop(self, _id, k, direction='both'):
+        """{id: hops} for every pattern within k hops of _id, following bigger
+        patterns ('up'), smaller patterns ('down') or both."""
+        directions = ['up', 'down'] if direction == 'both' else [direction]
+        hops = np.full(len(self.ids), -1, dtype=np.int32)
+        frontier = np.array([self.row[_id]], dtype=np.int32)
+        hops[frontier] = 0
+        for hop in range(1, k + 1):
+            reached = np.concatenate([expand_frontier(*self.adjacency[d], frontier) for d in directions])
+            frontier = np.unique(reached[hops[reached] < 0])
+            if not len(frontier):
+                break
+            hops[frontier] = hop
+        found = np.flatnonzero(hops >= 0)
+        return {self.ids[pos]: int(hops[pos]) for pos in found}
+
+    def display_name(self, _id):
+        return str(self.names[_id]).strip()
+
+    def neighbor_map(self):
+        """{id: neighbor ids} keyed on the string ids Cytoscape uses, for shipping to the browser."""
+        return {str(_id): self.neighbors(_id) for _id in self.ids}
+
+    def table_records(self, list_of_ids):
+        """Rows for the selected-nodes table, with neighbor ids translated to names.
+
+        Ids missing from the sheet are skipped, like create_elements does, whether
+        selected or only referenced by a selected pattern."""
+        data = []
+        for _id in list_of_ids:
+            if _id not in self:
+                continue
+            record = dict(self.records[_id])
+            record['Bigger Patterns'] = ', '.join(self.display_name(big) for big in self.bigger[_id]
+                                                  if big in self)
+            record['Smaller Patterns'] = ', '.join(self.display_name(small) for small in self.smaller[_id]
+                                                   if small in self)
+            data.append(record)
+        return data
+
+
+def selected_ids(selectedNodeData, index=None):
+    """Cytoscape hands node ids back as strings, the index is keyed on ints.
+
+    Group super-nodes of the level of detail view are not patterns and are skipped,
+    as are ids missing from index (a page loaded before the workbook was reloaded)."""
+    ids = [int(node['id']) for node in selectedNodeData or [] if node.get('kind') != 'group']
+    return ids if index is None else [_id for _id in ids if _id in index]
+
+
+###
+## Functions for making graphs
+###
+
+def dedupe_items(items, key):
+    """Yield items whose key has not been seen yet, keeping the first occurrence."""
+    seen = set()
+    for item in items:
+        item_key = key(item)
+        if item_key not in seen:
+            seen.add(item_key)
+            yield item
+
+
+def node_key(node):
+    return int(node['data']['id'])
+
+
+def edge_key(edge):
+    return int(edge['data']['source']), int(edge['data']['target'])
+
+
+def make_node(index, node_id):
+    node_id = int(node_id)
+    return {'data': {'id': node_id, 'label': index.names[node_id], 'group': index.groups[node_id],
+                     'smaller': len(index.smaller[node_id]), 'bigger': len(index.bigger[node_id])}}
+
+
+def make_edge(index, source, target):
+    # Edges always point from the smaller pattern up to the bigger one
+    return {'data': {'source': source, 'target': target,
+                     'label': '{big} -> {small}'.format(big=index.names[target], small=index.names[source]),
+                    },
+            'selectable': False}
+
+
+def make_graph_valid(nodes, edges, index):
+    """Drop duplicate nodes / edges and add any edge endpoint missing from nodes.
+
+    Nodes are keyed on id and edges on (source, target), so this is linear in the
+    size of the graph. Edges pointing at ids that are not in the sheet are dropped,
+    Cytoscape refuses to draw them."""
+    nodes = list(dedupe_items(nodes, node_key))
+    present = {node_key(node) for node in nodes}
+
+    valid_edges = []
+    for edge in dedupe_items(edges, edge_key):
+        for endpoint in edge_key(edge):
+            if endpoint not in present and endpoint in index:
+                nodes.append(make_node(index, endpoint))
+                present.add(endpoint)
+        source, target = edge_key(edge)
+        if source in present and target in present:
+            valid_edges.append(edge)
+
+    return nodes, valid_edges
+
+
+def create_elements(index, list_of_ids=None):
+    """Nodes and edges for the given patterns, or for the whole sheet by default.
+
+    Only the endpoints of the edges are added on top of list_of_ids, so building a
+    sub-graph costs O(selected + neighbors)."""
+    if list_of_ids is None:
+        list_of_ids = index.ids
+
+    nodes = []
+    edges = []
+    for _id in list_of_ids:
+        nodes.append(make_node(index, _id))
+        # Add the edges, always upward only... reciprocal edges are deduped to keep graph cleaner
+        for target in index.bigger[_id]:
+            if target in index:
+                edges.append(make_edge(index, _id, target))
+        for source in index.smaller[_id]:
+            if source in index:
+                edges.append(make_edge(index, source, _id))
+
+    return make_graph_valid(nodes, edges, index)
+
+
+def update_elements(index, nodes, edges, changed):
+    """Patch the main graph elements for the changed ids of an updated index.
+
+    Unchanged node and edge dicts are reused as they are, only nodes of changed
+    ids and edges touching them are rebuilt. Changed nodes keep their previous
+    position, new ones are placed at the centroid of their neighbors."""
+    old_nodes = {node_key(node): node for node in nodes}
+    new_nodes = []
+    for _id in index.ids:
+        if _id in old_nodes and _id not in changed:
+            new_nodes.append(old_nodes[_id])
+            continue
+        node = make_node(index, _id)
+        if _id in old_nodes and 'position' in old_nodes[_id]:
+            node['position'] = old_nodes[_id]['position']
+        else:
+            placed = [old_nodes[other]['position'] for other in index.neighbors(_id)
+                      if other in old_nodes and 'position' in old_nodes[other]]
+            if placed:
+                node['position'] = {'x': sum(p['x'] for p in placed) / len(placed),
+                                    'y': sum(p['y'] for p in placed) / len(placed)}
+        new_nodes.append(node)
+
+    new_edges = [edge for edge in edges if not changed.intersection(edge_key(edge))]
+
+    # Edges touching a changed id come from its own row or from rows referring to it
+    candidates = set()
+    for _id in changed:
+        if _id in index:
+            candidates.update((_id, target) for target in index.bigger[_id])
+            candidates.update((source, _id) for source in index.smaller[_id])
+        for other in index.references.get(_id, ()):
+            if _id in index.bigger[other]:
+                candidates.add((other, _id))
+            if _id in index.smaller[other]:
+                candidates.add((_id, other))
+    new_edges += [make_edge(index, source, target) for source, target in sorted(candidates)
+                  if source in index and target in index]
+    return new_nodes, new_edges
+
+
+def create_neighborhood_elements(index, list_of_ids):
+    """Nodes for exactly list_of_ids and the edges between them."""
+    included = {_id for _id in list_of_ids if _id in index}
+    nodes = [make_node(index, _id) for _id in dedupe_items(list_of_ids, lambda _id: _id) if _id in included]
+    edges = [make_edge(index, _id, target) for _id in included for target in index.bigger[_id] if target in included]
+    edges += [make_edge(index, source, _id) for _id in included for source in index.smaller[_id] if source in included]
+    return nodes, list(dedupe_items(edges, edge_key))
+
+
+def create_sub_elements(index, list_of_ids):
+    """The selected patterns plus their direct bigger / smaller neighbors."""
+    return create_elements(index, [_id for _id in list_of_ids if _id in index])
+
+
+###
+## Level of detail: one super-node per group, expanded into its patterns on demand
+###
+
+def group_node_id(group):
+    return 'g{}'.format(group)
+
+
+class GroupGraph:
+    """Group level view of the pattern graph with edge weights aggregated server-side.
+
+    Collapsed groups are drawn as a single node whose edges count the pattern
+    edges between groups. Expanded groups become compound nodes holding their
+    patterns, so only what is visible is ever sent to the browser. Positions
+    come from the full graph layout, a group sits at the centroid of its patterns."""
+
+    def __init__(self, index, nodes, edges):
+        self.index = index
+        self.nodes = {node['data']['id']: node for node in nodes}
+        self.members = {}
+        for _id in index.ids:
+            self.members.setdefault(index.groups[_id], []).append(_id)
+
+        self.pairs = [(int(edge['data']['source']), int(edge['data']['target'])) for edge in edges]
+        self.incident = {group: [] for group in self.members}
+        self.group_weights = {}
+        for i, (source, target) in enumerate(self.pairs):
+            source_group, target_group = index.groups[source], index.groups[target]
+            self.incident[source_group].append(i)
+            if target_group != source_group:
+                self.incident[target_group].append(i)
+                key = (source_group, target_group)
+                self.group_weights[key] = self.group_weights.get(key, 0) + 1
+
+        self.centroids = {}
+        for group, members in self.members.items():
+            positions = [self.nodes[_id]['position'] for _id in members if 'position' in self.nodes[_id]]
+            if positions:
+                self.centroids[group] = {'x': sum(p['x'] for p in positions) / len(positions),
+                                         'y': sum(p['y'] for p in positions) / len(positions)}
+
+    def visible_id(self, _id, expanded):
+        group = self.index.groups[_id]
+        return _id if group in expanded else group_node_id(group)
+
+    def group_node(self, group, expanded):
+        node = {'data': {'id': group_node_id(group), 'kind': 'group', 'group': group,
+                         'size': len(self.members[group]),
+                         'label': 'Group {} ({})'.format(group, len(self.members[group]))}}
+        # Expanded groups are compound parents, Cytoscape positions them from their children
+        if group not in expanded and group in self.centroids:
+            node['position'] = dict(self.centroids[group])
+        return node
+
+    def elements(self, expanded=()):
+        """Cytoscape elements with the groups in `expanded` opened up into their patterns."""
+        expanded = {group for group in expanded if group in self.members}
+
+        nodes = [self.group_node(group, expanded) for group in self.members]
+        for group in expanded:
+            for _id in self.members[group]:
+                node = dict(self.nodes[_id])
+                node['data'] = dict(node['data'], parent=group_node_id(group))
+                nodes.append(node)
+
+        # Start from the group level weights and only revisit edges touching an expanded group
+        weights = {(group_node_id(s), group_node_id(t)): w for (s, t), w in self.group_weights.items()}
+        revisit = {i for group in expanded for i in self.incident[group]}
+        for i in revisit:
+            source, target = self.pairs[i]
+            source_group, target_group = self.index.groups[source], self.index.groups[target]
+            if source_group != target_group:
+                key = (group_node_id(source_group), group_node_id(target_group))
+                weights[key] -= 1
+                if not weights[key]:
+                    del weights[key]
+            key = (self.visible_id(source, expanded), self.visible_id(target, expanded))
+            if key[0] != key[1]:
+                weights[key] = weights.get(key, 0) + 1
+
+        edges = [{'data': {'source': source, 'target': target, 'weight': weight,
+                           'label': '{} links'.format(weight)},
+                  'selectable': False}
+                 for (source, target), weight in weights.items()]
+        return nodes + edges
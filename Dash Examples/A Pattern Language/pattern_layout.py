@@ -0,0 +1,137 @@
+import numpy as np
+
+###
+## Server side force directed layout, so Cytoscape can draw with the 'preset' layout
+###
+
+# Pixels per node along each axis, keeps the default 30px nodes from overlapping
+NODE_SPACING = 40
+
+# Upper bound on the number of floats in the pairwise repulsion block of one iteration
+MAX_BLOCK = 4000000
+
+# Above this many nodes far away nodes are lumped together per grid cell for repulsion
+EXACT_REPULSION_NODES = 1000
+
+# Average nodes per grid cell in grid_repulsion
+CELL_NODES = 16
+
+
+def exact_repulsion(pos, k):
+    """Repulsion k^2 / d between every pair of nodes, in row blocks."""
+    n = len(pos)
+    disp = np.zeros((n, 2))
+    block = max(1, MAX_BLOCK // (2 * n))
+    for start in range(0, n, block):
+        delta = pos[start:start + block, None, :] - pos[None, :, :]
+        dist2 = np.maximum(np.einsum('ijk,ijk->ij', delta, delta), 1e-4)
+        disp[start:start + block] += np.einsum('ijk,ij->ik', delta, k * k / dist2)
+    return disp
+
+
+def grid_repulsion(pos, k):
+    """Repulsion k^2 / d with the nodes bucketed into a square grid of cells.
+
+    Nodes in the same or an adjacent cell repel each other exactly. Cells further
+    apart repel as single nodes of their combined weight at their centroids, and
+    every node of a cell moves with its cell. That is (n / CELL_NODES)^2 far pairs
+    instead of n^2, for forces off by a percent or two."""
+    n = len(pos)
+    side = max(3, int(np.sqrt(n / CELL_NODES)))
+    low = pos.min(axis=0)
+    size = np.maximum(pos.max(axis=0) - low, 1e-9) / side
+    cell_xy = np.minimum(((pos - low) / size).astype(np.intp), side - 1)
+    cells = cell_xy[:, 0] * side + cell_xy[:, 1]
+
+    counts = np.bincount(cells, minlength=side * side)
+    occupied = np.flatnonzero(counts)
+    centroids = np.stack([np.bincount(cells, weights=pos[:, axis], minlength=side * side)[occupied]
+                          for axis in range(2)], axis=1) / counts[occupied, None]
+    occupied_x, occupied_y = np.divmod(occupied, side)
+    weights = k * k * counts[occupied]
+
+    # Far cells, centroid to centroid
+    cell_disp = np.zeros((len(occupied), 2))
+    block = max(1, MAX_BLOCK // (2 * len(occupied)))
+    for start in range(0, len(occupied), block):
+        rows = slice(start, start + block)
+        delta = centroids[rows, None, :] - centroids[None, :, :]
+        dist2 = np.maximum(np.einsum('ijk,ijk->ij', delta, delta), 1e-4)
+        far = ((np.abs(occupied_x[rows, None] - occupied_x[None, :]) > 1)
+               | (np.abs(occupied_y[rows, None] - occupied_y[None, :]) > 1))
+        cell_disp[rows] = np.einsum('ijk,ij->ik', delta, np.where(far, weights / dist2, 0))
+    slot = np.zeros(side * side, dtype=np.intp)
+    slot[occupied] = np.arange(len(occupied))
+    disp = cell_disp[slot[cells]]
+
+    # Nodes of the 3x3 block of cells around each cell one by one, the cells of a grid row are contiguous
+    order = np.argsort(cells, kind='stable')
+    starts = np.searchsorted(cells[order], np.arange(side * side + 1)).tolist()
+    for cell, x, y in zip(occupied.tolist(), occupied_x.tolist(), occupied_y.tolist()):
+        members = order[starts[cell]:starts[cell + 1]]
+        near = np.concatenate([order[starts[row * side + max(y - 1, 0)]:starts[row * side + min(y + 1, side - 1) + 1]]
+                               for row in range(max(x - 1, 0), min(x + 2, side))])
+        delta = pos[members, None, :] - pos[None, near, :]
+        dist2 = np.maximum(np.einsum('ijk,ijk->ij', delta, delta), 1e-4)
+        disp[members] += np.einsum('ijk,ij->ik', delta, k * k / dist2)
+    return disp
+
+
+def spring_layout(node_ids, edge_pairs, iterations=50, seed=0):
+    """Fruchterman-Reingold layout vectorized with NumPy.
+
+    node_ids is a list of ids and edge_pairs a list of (source, target) ids.
+    Repulsion between all pairs is computed in row blocks so memory stays bounded,
+    above EXACT_REPULSION_NODES it is approximated with grid_repulsion.
+    Returns {id: (x, y)} in pixels, centred on the origin."""
+    n = len(node_ids)
+    if n == 0:
+        return {}
+    if n == 1:
+        return {node_ids[0]: (0.0, 0.0)}
+
+    position_of = {_id: i for i, _id in enumerate(node_ids)}
+    pairs = [(position_of[s], position_of[t]) for s, t in edge_pairs
+             if s in position_of and t in position_of and s != t]
+    src = np.array([s for s, t in pairs], dtype=np.intp)
+    dst = np.array([t for s, t in pairs], dtype=np.intp)
+
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n, 2))
+    k = np.sqrt(1.0 / n)
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    repulsion = exact_repulsion if n <= EXACT_REPULSION_NODES else grid_repulsion
+
+    for _ in range(iterations):
+        disp = repulsion(pos, k)
+
+        # Attraction d^2 / k along each edge
+        if len(src):
+            delta = pos[src] - pos[dst]
+            dist = np.maximum(np.linalg.norm(delta, axis=1), 1e-2)
+            force = delta * (dist / k)[:, None]
+            np.subtract.at(disp, src, force)
+            np.add.at(disp, dst, force)
+
+        # Move each node at most `temperature` along its displacement
+        length = np.maximum(np.linalg.norm(disp, axis=1), 1e-2)
+        pos += disp * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+
+    pos -= pos.mean(axis=0)
+    extent = np.abs(pos).max()
+    if extent > 0:
+        pos *= NODE_SPACING * np.sqrt(n) / (2 * extent)
+    return {_id: (float(x), float(y)) for _id, (x, y) in zip(node_ids, pos)}
+
+
+def layout_elements(nodes, edges, **kwargs):
+    """Store spring layout positions in the Cytoscape nodes (in place) and return them."""
+    positions = spring_layout([node['data']['id'] for node in nodes],
+                              [(edge['data']['source'], edge['data']['target']) for edge in edges],
+                              **kwargs)
+    for node in nodes:
+        x, y = positions[node['data']['id']]
+        node['position'] = {'x': x, 'y': y}
+    return nodes
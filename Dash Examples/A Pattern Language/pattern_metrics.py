@@ -0,0 +1,128 @@
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from dash.exceptions import PreventUpdate
+from flask import g, has_request_context, jsonify, request
+
+###
+## Per-callback latency and payload size, served as JSON on /metrics
+##
+## Each gunicorn worker keeps its own numbers, /metrics reports the worker
+## that answered the request (its pid is included in the response).
+###
+
+# Latency samples kept per callback for the percentiles
+MAX_SAMPLES = 2048
+
+
+class CallbackStats:
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.calls = 0
+        self.prevented = 0
+        self.errors = 0
+        self.total_bytes = 0
+        self.latencies = deque(maxlen=max_samples)
+        self.sizes = deque(maxlen=max_samples)
+
+    def summary(self):
+        summary = {'calls': self.calls, 'prevented': self.prevented, 'errors': self.errors,
+                   'total_bytes': self.total_bytes}
+        if self.latencies:
+            p50, p95, p99 = np.percentile(np.fromiter(self.latencies, dtype=float), [50, 95, 99]) * 1000
+            summary.update({'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)})
+        if self.sizes:
+            summary['mean_bytes'] = float(np.mean(np.fromiter(self.sizes, dtype=float)))
+        return summary
+
+
+class CallbackMetrics:
+    """Thread safe store of CallbackStats by callback name, plus the caches to report on."""
+
+    def __init__(self):
+        self.stats = {}
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds=None, outcome='ok'):
+        with self._lock:
+            stats = self.stats.setdefault(name, CallbackStats())
+            stats.calls += 1
+            if outcome == 'prevented':
+                stats.prevented += 1
+            elif outcome == 'error':
+                stats.errors += 1
+            if seconds is not None:
+                stats.latencies.append(seconds)
+
+    def record_size(self, name, size):
+        with self._lock:
+            stats = self.stats.setdefault(name, CallbackStats())
+            stats.sizes.append(size)
+            stats.total_bytes += size
+
+    def register_cache(self, name, cache):
+        """Report cache.stats() alongside the callbacks."""
+        self.caches[name] = cache
+
+    def snapshot(self):
+        with self._lock:
+            callbacks = {name: stats.summary() for name, stats in self.stats.items()}
+        return {'callbacks': callbacks,
+                'caches': {name: cache.stats() for name, cache in self.caches.items()}}
+
+
+metrics = CallbackMetrics()
+
+
+def instrument(name, registry=metrics):
+    """Decorator recording latency of a Dash callback under `name`.
+
+    The response size is recorded by register_payload_sizes once Dash has serialized it."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except PreventUpdate:
+                registry.record(name, time.perf_counter() - start, outcome='prevented')
+                raise
+            except Exception:
+                registry.record(name, time.perf_counter() - start, outcome='error')
+                raise
+            registry.record(name, time.perf_counter() - start)
+            if has_request_context():
+                g.metrics_callback = name
+            return result
+        return wrapper
+    return decorator
+
+
+def register_payload_sizes(server, registry=metrics, route='/_dash-update-component'):
+    """Record the size of the response Dash sends for each instrumented callback.
+
+    Reads Content-Length in an after_request hook, so nothing is serialized twice."""
+    @server.after_request
+    def record_payload_size(response):
+        name = g.pop('metrics_callback', None)
+        if name is not None and request.path.endswith(route) and response.content_length is not None:
+            registry.record_size(name, response.content_length)
+        return response
+
+    return record_payload_size
+
+
+def register_metrics_route(server, registry=metrics, route='/metrics'):
+    """Expose registry.snapshot() as JSON on the Flask server behind the Dash app."""
+    @server.route(route)
+    def callback_metrics():
+        snapshot = registry.snapshot()
+        snapshot['pid'] = os.getpid()
+        return jsonify(snapshot)
+
+    return callback_metrics
@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from pattern_cache import DATA_FILE, CACHE_FILE, file_hash, write_cache
+from pattern_graph import GroupGraph, create_sub_elements, update_elements
+from pattern_layout import layout_elements
+
+logger = logging.getLogger(__name__)
+
+###
+## Hot reload of the pattern workbook
+##
+## When the workbook changes, only the rows that differ are reparsed and the
+## index, elements and search are patched around them. The new dataset is
+## swapped in with a single assignment, so a request sees either the old or
+## the new dataset, never a mix.
+###
+
+
+def same_value(a, b):
+    # NaN never equals itself, treat two empty cells as the same
+    return a == b or (a != a and b != b)
+
+
+def changed_ids(old_records, new_records):
+    """Ids added, removed or edited between two {id: record} mappings."""
+    changed = set(old_records).symmetric_difference(new_records)
+    for _id, record in new_records.items():
+        old = old_records.get(_id)
+        if old is not None and (old.keys() != record.keys()
+                                or not all(same_value(old[key], record[key]) for key in record)):
+            changed.add(_id)
+    return changed
+
+
+def update_dataset(dataset, df, data_hash=None):
+    """A new dataset for df that only recomputes what the changed rows affect."""
+    old_index = dataset['index']
+    records = dict(zip((int(_id) for _id in df['id'].tolist()), df.to_dict('records')))
+    changed = changed_ids(old_index.records, records)
+
+    index = old_index.updated(df, records, changed)
+    nodes, edges = update_elements(index, dataset['nodes'], dataset['edges'], changed)
+    sub_nodes, sub_edges = create_sub_elements(index, [1])
+    layout_elements(sub_nodes, sub_edges)
+    return {
+        'hash': data_hash,
+        'df': df,
+        'index': index,
+        'nodes': nodes,
+        'edges': edges,
+        'default_sub_elements': sub_nodes + sub_edges,
+        # Group weights depend on every edge, rebuilding is linear and cheap next to parsing
+        'group_graph': GroupGraph(index, nodes, edges),
+        'search': dataset['search'].updated(index, changed),
+        'changed': changed,
+    }
+
+
+class DatasetReloader:
+    """Holds the live dataset and swaps in a patched one when the workbook changes.
+
+    current() checks the workbook's modification time at most every `interval`
+    seconds, so reloading works in every gunicorn worker without a watcher
+    thread (threads started before --preload forks don't survive the fork).
+    prepare(dataset) runs on every new dataset before it goes live. If reading,
+    patching or preparing fails the error is logged, the old dataset stays live
+    and the workbook is tried again on the next check."""
+
+    def __init__(self, dataset, data_file=DATA_FILE, cache_file=CACHE_FILE, interval=None, prepare=None):
+        self.data_file = data_file
+        self.cache_file = cache_file
+        self.interval = interval
+        self.prepare = prepare
+        self.reloads = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._mtime = self.modification_time()
+        self.dataset = prepare(dataset) if prepare else dataset
+
+    def modification_time(self):
+        try:
+            return os.stat(self.data_file).st_mtime
+        except OSError:
+            return None
+
+    def current(self):
+        """The live dataset, reloaded first if the workbook has changed."""
+        if self.interval is not None and time.monotonic() - self._checked >= self.interval:
+            self.check()
+        return self.dataset
+
+    def check(self):
+        """Reload if the workbook changed on disk. Returns True when a new dataset went live."""
+        # Only one thread reloads, the others keep serving the current dataset
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked = time.monotonic()
+            mtime = self.modification_time()
+            if mtime is None or mtime == self._mtime:
+                return False
+
+            data_hash = file_hash(self.data_file)
+            if data_hash == self.dataset.get('hash'):
+                self._mtime = mtime
+                return False
+
+            try:
+                dataset = update_dataset(self.dataset, pd.read_excel(self.data_file), data_hash)
+                try:
+                    write_cache({key: value for key, value in dataset.items() if key != 'changed'},
+                                data_hash, self.cache_file)
+                except OSError:
+                    logger.warning('Could not write the cache %s', self.cache_file, exc_info=True)
+                if self.prepare:
+                    dataset = self.prepare(dataset)
+            except Exception:
+                # Most likely caught the workbook half saved, keep serving and retry next time
+                self.failures += 1
+                logger.exception('Reloading %s failed, still serving the previous dataset', self.data_file)
+                return False
+            self.dataset = dataset
+            self._mtime = mtime
+            self.reloads += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        return {'reloads': self.reloads, 'failures': self.failures, 'hash': self.dataset.get('hash'),
+                'patterns': len(self.dataset['index'])}
@@ -0,0 +1,151 @@
+import copy
+import re
+from bisect import bisect_left
+
+###
+## Inverted index over the text columns of the pattern sheet
+###
+
+TOKEN = re.compile(r'[a-z0-9]+')
+
+# Columns left out of the text index: pattern ids, and the numeric 'Group' which
+# would make a bare number in the query match a whole group
+ID_COLUMNS = ('id', 'Group', 'Bigger Patterns', 'Smaller Patterns')
+
+# Terms shorter than this only match exactly or by prefix, one typo in them changes too much
+MIN_FUZZY_LENGTH = 4
+
+
+def tokenize(text):
+    return TOKEN.findall(str(text).lower())
+
+
+def deletes(term):
+    """Every variant of term with one character removed."""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+class PatternSearch:
+    """Prefix and typo tolerant search over 'Pattern Name' and the other text columns.
+
+    Everything is built once, a lookup only touches the postings of matching terms.
+    Fuzzy matching uses a one-character deletion index, so terms within one
+    insertion, deletion or substitution of a query token are found without a scan."""
+
+    def __init__(self, index, columns=None):
+        if columns is None:
+            columns = [c for c in index.columns if c not in ID_COLUMNS]
+        self.index = index
+        self.columns = columns
+
+        postings = {}
+        name_terms = {}
+        for _id in index.ids:
+            name_terms[_id] = set(tokenize(index.names[_id]))
+            for term in self.document_terms(index, _id):
+                postings.setdefault(term, set()).add(_id)
+
+        self.postings = postings
+        self.name_terms = name_terms
+        self.vocabulary = sorted(postings)
+        self.deletions = {}
+        for term in self.vocabulary:
+            self.add_deletions(self.deletions, term)
+
+    def document_terms(self, index, _id):
+        record = index.records[_id]
+        terms = set()
+        for column in self.columns:
+            value = record.get(column)
+            if value is None or value != value:  # skip empty / NaN cells
+                continue
+            terms.update(tokenize(value))
+        return terms
+
+    @staticmethod
+    def add_deletions(deletions, term):
+        if len(term) >= MIN_FUZZY_LENGTH:
+            for variant in deletes(term):
+                deletions[variant] = deletions.get(variant, set()) | {term}
+
+    def updated(self, index, changed):
+        """A new search over an updated index that only re-tokenizes the changed ids.
+
+        Sets touched by the update are replaced rather than modified, so this
+        instance keeps answering correctly for requests still using it."""
+        new = copy.copy(self)
+        new.index = index
+        new.postings = dict(self.postings)
+        new.name_terms = dict(self.name_terms)
+
+        for _id in changed:
+            if _id in self.index:
+                for term in self.document_terms(self.index, _id):
+                    new.postings[term] = new.postings[term] - {_id}
+                    if not new.postings[term]:
+                        del new.postings[term]
+                new.name_terms.pop(_id, None)
+            if _id in index:
+                for term in new.document_terms(index, _id):
+                    new.postings[term] = new.postings.get(term, set()) | {_id}
+                new.name_terms[_id] = set(tokenize(index.names[_id]))
+
+        new.vocabulary = sorted(new.postings)
+        removed = set(self.postings) - set(new.postings)
+        added = set(new.postings) - set(self.postings)
+        if removed or added:
+            new.deletions = dict(self.deletions)
+            for term in removed:
+                if len(term) >= MIN_FUZZY_LENGTH:
+                    for variant in deletes(term):
+                        new.deletions[variant] = new.deletions[variant] - {term}
+                        if not new.deletions[variant]:
+                            del new.deletions[variant]
+            for term in added:
+                self.add_deletions(new.deletions, term)
+        return new
+
+    def prefix_terms(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + '\uffff')
+        return self.vocabulary[start:end]
+
+    def fuzzy_terms(self, token):
+        terms = {token} if token in self.postings else set()
+        if len(token) < MIN_FUZZY_LENGTH:
+            return terms
+        variants = deletes(token)
+        # One extra character in the term, or one substitution
+        for variant in variants | {token}:
+            terms |= self.deletions.get(variant, set())
+        # One extra character in the token
+        terms |= {variant for variant in variants if variant in self.postings}
+        return terms
+
+    def search(self, query, limit=20):
+        """Ids of patterns matching every token of query, best matches first.
+
+        Every token is also matched as a prefix, not only the one still being typed,
+        so 'patt 1' finds 'Pattern 1' and also 'Pattern 10' to 'Pattern 19'.
+        Patterns whose name matches a token rank above matches in other columns."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        matches = None
+        scores = {}
+        for token in tokens:
+            terms = self.fuzzy_terms(token)
+            terms.update(self.prefix_terms(token))
+            ids = set()
+            for term in terms:
+                ids |= self.postings[term]
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+            for _id in matches:
+                if self.name_terms[_id] & terms:
+                    scores[_id] = scores.get(_id, 0) + 1
+
+        ranked = sorted(matches, key=lambda _id: (-scores.get(_id, 0), self.index.row[_id]))
+        return ranked[:limit]
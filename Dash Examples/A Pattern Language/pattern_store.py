@@ -0,0 +1,145 @@
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+###
+## Read-only, memory mapped copy of the pattern graph shared by all gunicorn workers
+##
+## Each array is its own .npy file in a version directory inside the store. Workers
+## open them with mmap_mode='r', so the pages are backed by the file and shared
+## between processes instead of every worker holding a private copy on its heap.
+##
+## Only the CSR adjacency read by k_hop and the columns of the degree scatter are
+## used from here. PatternIndex keeps its own names / groups / bigger / smaller /
+## records dicts, and the DataFrame, Cytoscape elements and search index are
+## Python objects in each process too (shared copy-on-write when gunicorn
+## preloads the app, until the workers touch them).
+##
+## Every build is written to a new version directory under a temporary name and
+## never changed. The CURRENT file names the live version and is swapped with
+## os.replace, so a reader always finds either the old or the new store.
+###
+
+STORE_VERSION = 2
+
+POINTER_FILE = 'CURRENT'
+
+# Versions no longer current are removed once they are this old (seconds), so a
+# version another worker has just written but not yet pointed at is left alone
+STALE_SECONDS = 60
+
+ARRAYS = ('ids', 'names', 'groups', 'bigger_degree', 'smaller_degree',
+          'up_indptr', 'up_indices', 'down_indptr', 'down_indices')
+
+
+def graph_arrays(index):
+    """The array form of a PatternIndex: ids, names, groups, degree counts and CSR adjacency."""
+    groups = [index.groups[_id] for _id in index.ids]
+    try:
+        groups = np.asarray(groups, dtype=np.int32)
+    except (TypeError, ValueError):
+        groups = np.asarray(groups, dtype=np.float64)
+    return {
+        'ids': np.asarray(index.ids, dtype=np.int64),
+        'names': np.asarray([str(index.names[_id]) for _id in index.ids], dtype=np.str_),
+        'groups': groups,
+        # Counts of the references in the sheet, like the 'smaller' / 'bigger' node data
+        'bigger_degree': np.asarray([len(index.bigger[_id]) for _id in index.ids], dtype=np.int32),
+        'smaller_degree': np.asarray([len(index.smaller[_id]) for _id in index.ids], dtype=np.int32),
+        'up_indptr': index.adjacency['up'][0],
+        'up_indices': index.adjacency['up'][1],
+        'down_indptr': index.adjacency['down'][0],
+        'down_indices': index.adjacency['down'][1],
+    }
+
+
+def read_meta(directory):
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def version_name(data_hash=None):
+    """Unique directory name for a new version of the store."""
+    return 'v{}-{}-{}'.format(STORE_VERSION, (data_hash or 'nohash')[:16], uuid.uuid4().hex)
+
+
+def current_version(directory):
+    """Path of the version CURRENT points at, or None."""
+    try:
+        with open(os.path.join(directory, POINTER_FILE)) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+
+def write_graph_store(index, directory, data_hash=None):
+    """Write a new version of the store to `directory` and point CURRENT at it.
+
+    Old versions are removed after STALE_SECONDS, workers still mapping one keep their pages."""
+    if os.path.isdir(directory) and os.path.exists(os.path.join(directory, 'meta.json')):
+        # A store from before versions, its files are replaced by the first version
+        shutil.rmtree(directory)
+    os.makedirs(directory, exist_ok=True)
+    name = version_name(data_hash)
+    version_dir = os.path.join(directory, name)
+    tmp_dir = version_dir + '.tmp'
+    os.makedirs(tmp_dir)
+    for array_name, array in graph_arrays(index).items():
+        np.save(os.path.join(tmp_dir, array_name + '.npy'), array)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({'version': STORE_VERSION, 'hash': data_hash, 'patterns': len(index)}, f)
+    os.rename(tmp_dir, version_dir)
+
+    tmp_pointer = '{}.{}.tmp'.format(os.path.join(directory, POINTER_FILE), os.getpid())
+    with open(tmp_pointer, 'w') as f:
+        f.write(name)
+    os.replace(tmp_pointer, os.path.join(directory, POINTER_FILE))
+
+    current = os.path.basename(current_version(directory) or '')
+    for other in os.listdir(directory):
+        path = os.path.join(directory, other)
+        if other not in (name, current) and other.startswith('v') and os.path.isdir(path):
+            try:
+                stale = time.time() - os.path.getmtime(path) > STALE_SECONDS
+            except OSError:
+                continue
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+    return version_dir
+
+
+class GraphStore:
+    """Memory mapped arrays of one version of a store written by write_graph_store."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = read_meta(directory)
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+        self.adjacency = {'up': (self.up_indptr, self.up_indices),
+                          'down': (self.down_indptr, self.down_indices)}
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def open_graph_store(index, directory, data_hash=None):
+    """Map the current store in `directory`, writing a new version first if it is missing or stale."""
+    version_dir = current_version(directory)
+    meta = read_meta(version_dir) if version_dir else None
+    if meta is None or meta.get('version') != STORE_VERSION or meta.get('hash') != data_hash \
+            or meta.get('patterns') != len(index):
+        version_dir = write_graph_store(index, directory, data_hash)
+    try:
+        return GraphStore(version_dir)
+    except OSError:
+        # Another worker switched to a new workbook long ago and removed this version meanwhile
+        return GraphStore(write_graph_store(index, directory, data_hash))
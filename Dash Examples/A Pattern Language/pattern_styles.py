@@ -0,0 +1,199 @@
+from colour import Color
+
+###
+## Cytoscape stylesheets for the main graph and the sub-graph
+###
+
+red = Color("blue")
+colors = list(red.range_to(Color("green"),36))
+
+# Create color gradient for groups
+group_stylesheet = [{
+        "selector": '[group = {}]'.format(group+1),
+        'style': {
+            "opacity": .50,
+            'z-index': 9999,
+            'background-color': colors[group].hex
+        }
+} for group in range(36)]
+
+edge_style = {
+    "selector": 'edge',
+    'style': {
+        "curve-style": "bezier",
+        "opacity": 0.15,
+        'z-index': 5000
+    }
+}
+
+# Super-nodes and aggregated edges of the level of detail view (pattern_graph.GroupGraph)
+level_of_detail_stylesheet = [
+    {
+        "selector": 'node[kind = "group"]',
+        'style': {
+            "label": "data(label)",
+            "width": "mapData(size, 1, 40, 30, 120)",
+            "height": "mapData(size, 1, 40, 30, 120)"
+        }
+    },
+    {
+        "selector": ':parent',
+        'style': {
+            "background-opacity": 0.15
+        }
+    },
+    {
+        "selector": 'edge[weight]',
+        'style': {
+            "width": "mapData(weight, 1, 40, 1, 10)"
+        }
+    }
+]
+
+default_cyto_stylesheet = group_stylesheet + level_of_detail_stylesheet + [
+    # Instantiate with the first node highlight white as a prompt
+    {
+        "selector": 'node[id = "1"]',
+        'style': {
+            "opacity": 1,
+            'z-index': 9999,
+            'background-color': 'white',
+            "border-width": 2,
+            "border-color": "black",
+            "border-opacity": 1
+        }
+    },
+    edge_style,
+    # In the main graph, don't want to display names
+    {
+        'selector': ':selected',
+        "style": {
+            "border-width": 2,
+            "border-color": "black",
+            "border-opacity": 1,
+            "opacity": 1,
+            #"label": "data(label)",
+            "color": "black",
+            #"font-size": 12,
+            'z-index': 9999
+        }
+    }
+]
+
+
+default_cyto_subgraph_stylesheet = group_stylesheet + [
+    edge_style,
+    {
+        'selector': ':selected',
+        "style": {
+            "border-width": 2,
+            "border-color": "black",
+            "border-opacity": 1,
+            "opacity": 1,
+            "label": "data(label)",
+            "color": "black",
+            "font-size": 12,
+            'z-index': 9999
+        }
+    }
+]
+
+
+# Styles the main graph applies around a selection, shared with the clientside
+# highlighting in assets/highlight.js
+highlight_styles = {
+    # Add the name of the selected item, not the bigger and smaller patterns
+    'selected': {
+        "border-width": 2,
+        "border-color": "black",
+        "border-opacity": 1,
+        "opacity": 1,
+        "label": "data(label)",
+        "color": "black",
+        "font-size": 17,
+        'z-index': 9999,
+    },
+    'neighbor': {
+        #"label": "data(label)",
+        "border-width": 2,
+        "border-color": "black",
+        "border-opacity": 1,
+        'opacity': 0.9,
+        'z-index': 9999
+    },
+    'source': {
+        "line-color": "blue",
+        'opacity': 0.9,
+        'z-index': 9999
+    },
+    'target': {
+        "line-color": "green",
+        'opacity': 0.9,
+        'z-index': 9999
+    },
+}
+
+
+def edge_highlights(_id):
+    """Colour the edges leaving (blue) and entering (green) a selected pattern."""
+    return [{
+                "selector": '[source = "{}"]'.format(_id),
+                "style": highlight_styles['source']
+            },
+            {
+                "selector": '[target = "{}"]'.format(_id),
+                "style": highlight_styles['target']
+            }]
+
+
+# The part of the main graph stylesheet that doesn't depend on the selection
+base_main_stylesheet = group_stylesheet + level_of_detail_stylesheet + [
+    edge_style,
+    {
+        'selector': ':selected',
+        "style": highlight_styles['selected']
+    }
+]
+
+
+def main_stylesheet(index, list_of_ids):
+    """Stylesheet for the main graph: label the selection, outline its neighbors."""
+    new_stylesheet = base_main_stylesheet + []
+
+    for _id in list_of_ids:
+        new_stylesheet += edge_highlights(_id)
+        for neighbor in index.neighbors(_id):
+            new_stylesheet.append({
+                "selector": 'node[id = "{}"]'.format(neighbor),
+                "style": highlight_styles['neighbor']
+            })
+    return new_stylesheet
+
+
+def subgraph_stylesheet(index, list_of_ids):
+    """Stylesheet for the sub-graph: label the selection and all of its neighbors."""
+    cyto_subgraph_stylesheet = group_stylesheet + []
+
+    for _id in list_of_ids:
+        cyto_subgraph_stylesheet += edge_highlights(_id)
+        cyto_subgraph_stylesheet.append({
+            "selector": 'node[id = "{}"]'.format(_id),
+            "style": {
+                "label": "data(label)",
+                "border-width": 2,
+                "border-color": "black",
+                "border-opacity": 1,
+                'opacity': 1,
+                'z-index': 9999
+            }
+        })
+        for neighbor in index.neighbors(_id):
+            cyto_subgraph_stylesheet.append({
+                "selector": 'node[id = "{}"]'.format(neighbor),
+                "style": {
+                    "label": "data(label)",
+                    'opacity': 0.9,
+                    'z-index': 9999
+                }
+            })
+    return cyto_subgraph_stylesheet
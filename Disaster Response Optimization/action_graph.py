@@ -0,0 +1,128 @@
+"""Distances between action sites, cached on disk, and the action graph built from them.
+
+Building G2 with nx.all_pairs_dijkstra_path_length searches from every node of
+the road network to every other and keeps only the distances between action
+sites. Here Dijkstra runs from the action sites only and stops as soon as
+every other site is settled. The result is a dense float32 matrix saved as a
+.npy next to the notebook, named after a hash of the road graph and the site
+list, so a rerun on the same data maps the file instead of searching again.
+
+    distances = site_distances(G, action_locations, cache_dir=".")
+    G2 = build_action_graph(G, valid_actions, cache_dir=".")
+"""
+import hashlib
+import heapq
+import os
+
+import numpy as np
+
+# Minutes to walk one kilometer, as assumed when building the action graph
+MINUTES_PER_KM = 15
+
+
+def graph_hash(graph, sites, weight="length"):
+    """sha256 of the graph's edges and weights and of the ordered site list."""
+    digest = hashlib.sha256()
+    digest.update(repr(graph.is_directed()).encode())
+    for u, v, w in graph.edges(data=weight):
+        digest.update(repr((u, v, w)).encode())
+    digest.update(repr(list(sites)).encode())
+    return digest.hexdigest()
+
+
+def weighted_adjacency(graph, weight="length"):
+    """{node: [(neighbor, weight), ...]} keeping the shortest of parallel edges."""
+    adjacency = {}
+    for node, neighbors in graph.adj.items():
+        edges = []
+        for next_node, data in neighbors.items():
+            if graph.is_multigraph():
+                w = min(d.get(weight, 1) for d in data.values())
+            else:
+                w = data.get(weight, 1)
+            edges.append((next_node, w))
+        adjacency[node] = edges
+    return adjacency
+
+
+def distances_from(adjacency, source, targets):
+    """Shortest distance from source to each node of targets, stopping once all are settled."""
+    remaining = set(targets)
+    found = {}
+    settled = set()
+    heap = [(0, source)]
+    seen = {source: 0}
+    while heap and remaining:
+        distance, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        settled.add(node)
+        if node in remaining:
+            remaining.discard(node)
+            found[node] = distance
+        for next_node, w in adjacency[node]:
+            next_distance = distance + w
+            if next_node not in settled and next_distance < seen.get(next_node, np.inf):
+                seen[next_node] = next_distance
+                heapq.heappush(heap, (next_distance, next_node))
+    return found
+
+
+def compute_site_distances(graph, sites, weight="length"):
+    """(n_sites, n_sites) float32 matrix of shortest distances, inf where unreachable."""
+    adjacency = weighted_adjacency(graph, weight)
+    index = {site: i for i, site in enumerate(sites)}
+    distances = np.full((len(sites), len(sites)), np.inf, dtype=np.float32)
+    for i, site in enumerate(sites):
+        for target, distance in distances_from(adjacency, site, sites).items():
+            distances[i, index[target]] = distance
+    return distances
+
+
+def site_distances(graph, sites, weight="length", cache_dir=None):
+    """Distance matrix between sites, read from / written to cache_dir when given.
+
+    A cached matrix is memory mapped read-only."""
+    sites = list(sites)
+    if cache_dir is None:
+        return compute_site_distances(graph, sites, weight)
+
+    cache_file = os.path.join(cache_dir, "site_distances_{}.npy".format(graph_hash(graph, sites, weight)[:16]))
+    try:
+        distances = np.load(cache_file, mmap_mode="r")
+        if distances.shape == (len(sites), len(sites)):
+            return distances
+    except (OSError, ValueError):
+        pass
+
+    distances = compute_site_distances(graph, sites, weight)
+    # Write to a temporary file first so a crash can't leave a truncated cache behind
+    tmp_file = "{}.{}.tmp.npy".format(cache_file[:-len(".npy")], os.getpid())
+    np.save(tmp_file, distances)
+    os.replace(tmp_file, cache_file)
+    return np.load(cache_file, mmap_mode="r")
+
+
+def action_times(distances, sites, valid_actions, minutes_per_km=MINUTES_PER_KM):
+    """(n_sites, n_sites) minutes to travel from site i to site j and complete its action.
+
+    Can be passed straight to action_sequences instead of going through G2."""
+    time_to_save = np.array([valid_actions[site]["time_to_save"] for site in sites], dtype=np.float64)
+    return np.asarray(distances, dtype=np.float64) / 1000 * minutes_per_km + time_to_save[None, :]
+
+
+def build_action_graph(graph, valid_actions, weight="length", cache_dir=None, minutes_per_km=MINUTES_PER_KM):
+    """G2 as built in the notebook, an nx.Graph between action sites with
+    transition_time and action_id on every edge. Unreachable pairs get no edge."""
+    import networkx as nx
+
+    sites = list(valid_actions.keys())
+    times = action_times(site_distances(graph, sites, weight, cache_dir), sites, valid_actions, minutes_per_km)
+
+    action_graph = nx.Graph()
+    action_graph.add_nodes_from(sites)
+    for i, site in enumerate(sites):
+        for j, next_site in enumerate(sites):
+            if np.isfinite(times[i, j]):
+                action_graph.add_edge(site, next_site, transition_time=float(times[i, j]), action_id=next_site)
+    return action_graph
@@ -0,0 +1,259 @@
+"""Best timed action sequences on the action graph by label setting.
+
+create_timed_action_sequences keeps every simple path of G2 at every minute up to
+max_time, and find_num_people_saved scores them afterwards. Here each partial
+sequence is a label (current site, visited sites as a bitmask, elapsed time,
+people saved). Labels are extended in order of elapsed time, and a label is
+dropped as soon as another label at the same site has visited no more sites
+(a subset) in no more time and saved at least as many people, since anything
+it could still do the other can do as well. What survives per start site is the
+Pareto front of (time used, people saved).
+
+Dominance keeps the number of labels small when sites differ. When many sites
+are alike (the same number of people, equal travel times as on a grid) few
+labels dominate each other, and the labels grow exponentially with the number
+of sites reachable within max_time: 30 sites on a grid took minutes per start.
+A budget of max_labels per start or a time_limit over all starts stops the
+search early, returning the best sequences found so far.
+
+    sites, times, people = action_arrays(G2, valid_actions)
+    best_action_sequences = best_timed_sequences(sites, times, people, 200, time_limit=60)
+"""
+import heapq
+import math
+from time import monotonic
+
+import numpy as np
+
+
+def action_arrays(graph, valid_actions, time_attr="transition_time", round_times=False):
+    """The action graph as arrays: site ids, an (n, n) matrix of minutes to go from
+    site i to site j and complete its action (inf where there is no edge) and the
+    people saved at each site.
+
+    round_times rounds steps to whole minutes like create_timed_action_sequences."""
+    sites = list(graph.nodes())
+    index = {site: i for i, site in enumerate(sites)}
+    times = np.full((len(sites), len(sites)), np.inf)
+    for site, next_site, time in graph.edges(data=time_attr):
+        times[index[site], index[next_site]] = time
+        if not graph.is_directed():
+            times[index[next_site], index[site]] = time
+    if round_times:
+        times = np.round(times)
+    np.fill_diagonal(times, np.inf)
+    people = np.array([valid_actions[site]["save_num_people"] for site in sites])
+    return sites, times, people
+
+
+def shortest_times(times):
+    """Fastest time from every site to every other, chaining actions (Floyd-Warshall)."""
+    shortest = np.array(times, dtype=float)
+    for k in range(len(shortest)):
+        np.minimum(shortest, shortest[:, k, None] + shortest[None, k, :], out=shortest)
+    return shortest
+
+
+class Reach:
+    """Which sites can still be visited from a site with a given amount of time left.
+
+    Sites out of reach are as good as visited, so they are added to a label's mask
+    before comparing labels (Feillet et al.). That makes far more labels comparable
+    and is what keeps the number of labels small."""
+
+    def __init__(self, times, shortest=None):
+        shortest = shortest_times(times) if shortest is None else shortest
+        self.order = np.argsort(shortest, axis=1, kind="stable")
+        self.sorted_times = np.take_along_axis(shortest, self.order, axis=1)
+        self.masks = []
+        for order in self.order.tolist():
+            prefix = [0]
+            for site in order:
+                prefix.append(prefix[-1] | 1 << site)
+            self.masks.append(prefix)
+
+    def mask(self, site, time_left):
+        """Bitmask of the sites reachable from site within time_left."""
+        return self.masks[site][int(np.searchsorted(self.sorted_times[site], time_left, side="right"))]
+
+
+def greedy_sequence(times, people, max_time, start, start_time=0):
+    """(people saved, time used, [site indices]) by cheapest insertion: the site with the most
+    people per extra minute goes in at its best place after start, until nothing fits.
+    A quick first answer for pareto_sequences to beat."""
+    sequence = [start]
+    time = start_time
+    free = np.ones(len(people), dtype=bool)
+    free[start] = False
+    while free.any():
+        candidates = np.flatnonzero(free)
+        before = np.array(sequence)
+        # Row p is inserting after sequence[p], the extra time of the last row is just the step there
+        extra = times[before][:, candidates]
+        if len(sequence) > 1:
+            extra[:-1] += times[candidates][:, before[1:]].T - times[before[:-1], before[1:]][:, None]
+        fits = extra <= max_time - time
+        if not fits.any():
+            break
+        rate = np.where(fits, people[candidates][None, :] / np.maximum(extra, 1e-9), -np.inf)
+        position, column = np.unravel_index(np.argmax(rate), rate.shape)
+        sequence.insert(position + 1, int(candidates[column]))
+        free[candidates[column]] = False
+        time += float(extra[position, column])
+    return people[sequence].sum().item(), time, sequence
+
+
+def pareto_sequences(times, people, max_time, start, start_time=0, reach=None, front=True,
+                     deadline=None, max_labels=None):
+    """Pareto front of the simple sequences from start within max_time minutes.
+
+    Returns [(people saved, time used, [site indices]), ...] ordered by time, each
+    saving more people than every faster one. start_time is spent at the start
+    site before leaving, 0 as in create_timed_action_sequences. Pass a Reach built
+    once when solving for many start sites.
+
+    With front=False only one sequence saving the most people is returned, which
+    lets every label that can't beat the best sequence found so far be dropped.
+
+    The search stops at the deadline (a time.monotonic() value) or once
+    max_labels labels were created, and the front of the labels so far is
+    returned. It is then not necessarily optimal."""
+    n = len(people)
+    reach = Reach(times) if reach is None else reach
+    everything = (1 << n) - 1
+    steps = times.tolist()
+
+    # Each site visited costs at least its fastest way in, the fractional knapsack over
+    # those costs bounds what a label can still save. Sites in order of people per minute.
+    cheapest = times.min(axis=0)
+    by_rate = sorted(range(n), key=lambda j: -people[j] / cheapest[j] if cheapest[j] > 0 else -np.inf)
+    cheapest = cheapest.tolist()
+    # Whole people can only be saved, so a fractional bound rounds down
+    whole = bool(np.all(people == np.round(people)))
+    people = people.tolist()
+
+    def upper_bound(mask, time, saved):
+        time_left = max_time - time
+        for j in by_rate:
+            if mask >> j & 1:
+                continue
+            # Zero time sites come first and are taken whole, even with no time left
+            if cheapest[j] > 0 and cheapest[j] >= time_left:
+                saved += people[j] * time_left / cheapest[j]
+                return math.floor(saved + 1e-9) if whole else saved
+            time_left -= cheapest[j]
+            saved += people[j]
+        return saved
+
+    def blocked(site, visited, time):
+        return visited | everything & ~reach.mask(site, max_time - time)
+
+    # labels[k] = (site, visited, blocked, time, saved, parent label), alive[k] False once dominated
+    labels = [(start, 1 << start, blocked(start, 1 << start, start_time), start_time, people[start], -1)]
+    alive = [True]
+    # The live labels at each site as (blocked, time, saved, k), for the dominance checks
+    at_site = {start: [labels[0][2:5] + (0,)]}
+    heap = [(start_time, -people[start], 0)]
+    # For the front, the most people saved by a label already taken off the heap, i.e. by a
+    # sequence at most this long. Otherwise the most saved by any sequence so far, starting
+    # from a greedy one, and the label that saved it.
+    if front:
+        best = people[start]
+    else:
+        greedy = greedy_sequence(times, np.asarray(people), max_time, start, start_time)
+        best, best_label = greedy[0], None
+    while heap:
+        if (max_labels is not None and len(labels) >= max_labels) or \
+                (deadline is not None and monotonic() >= deadline):
+            break
+        _, _, k = heapq.heappop(heap)
+        if not alive[k]:
+            continue
+        site, visited, mask, time, saved, _ = labels[k]
+        if front:
+            best = max(best, saved)
+        if upper_bound(mask, time, saved) <= best:
+            # Whatever this label goes on to do, another sequence saves as many people
+            continue
+        free = everything & ~mask
+        while free:
+            bit = free & -free
+            free ^= bit
+            next_site = bit.bit_length() - 1
+            next_time = time + steps[site][next_site]
+            if next_time > max_time:
+                continue
+            next_visited = visited | bit
+            next_mask = blocked(next_site, next_visited, next_time)
+            next_saved = saved + people[next_site]
+            if not front:
+                if next_saved > best:
+                    best, best_label = next_saved, len(labels)
+                elif upper_bound(next_mask, next_time, next_saved) <= best:
+                    continue
+            others = at_site.setdefault(next_site, [])
+            if any(other_time <= next_time and other_saved >= next_saved and not other_mask & ~next_mask
+                   for other_mask, other_time, other_saved, _ in others):
+                continue
+            keep = []
+            for other in others:
+                if next_time <= other[1] and next_saved >= other[2] and not next_mask & ~other[0]:
+                    alive[other[3]] = False
+                else:
+                    keep.append(other)
+            keep.append((next_mask, next_time, next_saved, len(labels)))
+            at_site[next_site] = keep
+            heapq.heappush(heap, (next_time, -next_saved, len(labels)))
+            labels.append((next_site, next_visited, next_mask, next_time, next_saved, k))
+            alive.append(True)
+
+    if front:
+        ends = []
+        for k in sorted((k for k in range(len(labels)) if alive[k]), key=lambda k: (labels[k][3], -labels[k][4])):
+            if not ends or labels[k][4] > labels[ends[-1]][4]:
+                ends.append(k)
+    elif best_label is None:
+        return [greedy]
+    else:
+        ends = [best_label]
+
+    def sequence(k):
+        path = []
+        while k != -1:
+            path.append(labels[k][0])
+            k = labels[k][5]
+        return path[::-1]
+
+    return [(labels[k][4], labels[k][3], sequence(k)) for k in ends]
+
+
+def pareto_timed_sequences(sites, times, people, max_time, starts=None, start_times=None, front=True,
+                           time_limit=None, max_labels=None):
+    """{site: Pareto front of pareto_sequences, with site ids} for every start site.
+
+    time_limit (seconds) is shared by all start sites, each one getting an even
+    share of what is left when its turn comes. max_labels applies per site."""
+    begin = monotonic()
+    index = {site: i for i, site in enumerate(sites)}
+    starts = list(sites if starts is None else starts)
+    reach = Reach(times)
+    fronts = {}
+    for done, site in enumerate(starts):
+        i = index[site]
+        start_time = 0 if start_times is None else start_times[i]
+        deadline = None
+        if time_limit is not None:
+            now = monotonic()
+            deadline = now + max(0, begin + time_limit - now) / (len(starts) - done)
+        fronts[site] = [(saved, time, [sites[j] for j in sequence])
+                        for saved, time, sequence in pareto_sequences(times, people, max_time, i, start_time, reach,
+                                                                      front, deadline, max_labels)]
+    return fronts
+
+
+def best_timed_sequences(sites, times, people, max_time, starts=None, start_times=None, time_limit=None,
+                         max_labels=None):
+    """Same format as the notebook's best_action_sequences: {site: [best_lives_saved, sequence]}."""
+    fronts = pareto_timed_sequences(sites, times, people, max_time, starts, start_times, front=False,
+                                    time_limit=time_limit, max_labels=max_labels)
+    return {site: [front[-1][0], front[-1][2]] for site, front in fronts.items()}
@@ -0,0 +1,193 @@
+"""Branch and bound for the best scoring walk, with a time or expansion budget.
+
+findPaths and create_n_paths only know the best walk after enumerating them all.
+This search goes depth first, most promising neighbor first, so it holds a
+complete walk after `length` steps and keeps improving it. A branch is cut as
+soon as its optimistic bound can't beat the best walk found so far, and when
+the budget runs out the best walk so far is returned, flagged as not proven.
+
+The bound for a walk at node u with h moves left is its score plus the smaller of
+  - the best sum of h values along any h-move walk from u, repeats counted, and
+  - the sum of the h largest values within h hops of u.
+Both count negative values as 0, as a step never adds more than that, and
+ignore which nodes are already visited, so they only ever overestimate.
+The second takes a BFS around every node, with a time limit the nodes it
+doesn't get to in time are left with the first.
+
+    best_paths, proven = anytime_best_paths(csr, values, 10, time_limit=5)
+"""
+import time
+
+import numpy as np
+
+# Share of anytime_best_paths' time_limit the bound may take
+BOUND_SHARE = 0.25
+
+# Expansions between looks at the clock
+CHECK_EVERY = 16
+
+
+class WalkBound:
+    """bound[h][u]: at least the most a walk of h more moves from u can add, -inf if there is none.
+
+    The ball sums stop at the deadline (a time.monotonic() value), nodes not
+    reached by then only get the walk sum bound."""
+
+    def __init__(self, csr, values, max_hops, deadline=None):
+        # A new node never adds more than max(value, 0), the sums below count nothing less
+        values = np.maximum(np.asarray(values, dtype=np.float64), 0)
+        n = len(csr)
+        sources = np.repeat(np.arange(n), csr.degrees())
+        targets = csr.indices
+
+        # Best walk sum with repeats counted, a max-plus product along the edges
+        walk_sums = np.full((max_hops + 1, n), -np.inf)
+        walk_sums[0] = 0
+        for h in range(1, max_hops + 1):
+            np.maximum.at(walk_sums[h], sources, values[targets] + walk_sums[h - 1][targets])
+
+        # Largest h values within h hops, from a BFS of max_hops around every node
+        ball_sums = np.full((max_hops + 1, n), np.inf)
+        ball_sums[0] = 0
+        indptr, indices = csr.indptr.tolist(), csr.indices.tolist()
+        hop_limits = np.arange(1, max_hops + 1)[:, None]
+        for u in range(n):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            ball_sums[1:, u] = 0
+            hops = {u: 0}
+            frontier = [u]
+            for hop in range(1, max_hops + 1):
+                next_frontier = []
+                for node in frontier:
+                    for next_node in indices[indptr[node]:indptr[node + 1]]:
+                        if next_node not in hops:
+                            hops[next_node] = hop
+                            next_frontier.append(next_node)
+                frontier = next_frontier
+            del hops[u]
+            if not hops:
+                continue
+            ball_values = values[np.fromiter(hops.keys(), dtype=np.int64, count=len(hops))]
+            ball_hops = np.fromiter(hops.values(), dtype=np.int64, count=len(hops))
+            order = np.argsort(-ball_values, kind='stable')
+            ball_values, ball_hops = ball_values[order], ball_hops[order]
+            # Row h - 1 takes the first h values, largest first, that are within h hops
+            near = ball_hops[None, :] <= hop_limits
+            near &= np.cumsum(near, axis=1) <= hop_limits
+            ball_sums[1:, u] = near @ ball_values
+
+        self.max_hops = max_hops
+        self.bound = np.minimum(walk_sums, ball_sums).tolist()
+
+
+def anytime_best_walk(csr, start, length, values, bound=None, deadline=None, max_expansions=None):
+    """(score, walk of CSR indices, proven) for the best walk of `length` moves from start.
+
+    Stops at the deadline (a time.monotonic() value) or after max_expansions
+    nodes, but never before the first complete walk is found. proven is True
+    when the search finished, i.e. the walk is optimal. Returns None when no walk
+    of that length exists."""
+    bound = WalkBound(csr, values, length).bound if bound is None else bound
+    values = values.tolist() if hasattr(values, 'tolist') else list(values)
+    return _anytime_best_walk(csr.indptr.tolist(), csr.indices.tolist(), values, start, length, bound,
+                              deadline, max_expansions)
+
+
+def _anytime_best_walk(indptr, indices, values, start, length, bound, deadline, max_expansions):
+    """anytime_best_walk over the CSR arrays and values as lists, converted once by the caller."""
+    if bound[length][start] == -np.inf:
+        return None
+    counts = {start: 1}
+    path = [start]
+    score = values[start]
+    best_score, best_walk = -np.inf, None
+    expansions = 0
+
+    def children(node, moves_left):
+        """Neighbors worth trying next, most optimistic first, as (optimistic score, neighbor)."""
+        options = []
+        for next_node in indices[indptr[node]:indptr[node + 1]]:
+            rest = bound[moves_left - 1][next_node]
+            if rest == -np.inf:
+                continue
+            gain = 0 if next_node in counts else values[next_node]
+            options.append((score + gain + rest, next_node))
+        options.sort(key=lambda option: -option[0])
+        return options
+
+    stack = [children(start, length)]
+    positions = [0]
+    while stack:
+        options = stack[-1]
+        position = positions[-1]
+        depth = len(stack)
+        if position < len(options) and options[position][0] > best_score:
+            positions[-1] += 1
+            next_node = options[position][1]
+            if next_node not in counts:
+                score += values[next_node]
+            counts[next_node] = counts.get(next_node, 0) + 1
+            path.append(next_node)
+            expansions += 1
+            if depth == length:
+                if score > best_score:
+                    best_score, best_walk = score, list(path)
+            else:
+                stack.append(children(next_node, length - depth))
+                positions.append(0)
+                continue
+        else:
+            # Remaining options can't beat the best walk, step back
+            stack.pop()
+            positions.pop()
+            if not stack:
+                break
+        node = path.pop()
+        counts[node] -= 1
+        if not counts[node]:
+            del counts[node]
+            score -= values[node]
+
+        if best_walk is not None and (
+                (max_expansions is not None and expansions >= max_expansions)
+                or (deadline is not None and expansions % CHECK_EVERY == 0 and time.monotonic() >= deadline)):
+            return best_score, best_walk, False
+    return best_score, best_walk, True
+
+
+def anytime_best_paths(csr, values, max_path_length, time_limit=None, max_expansions=None, starts=None):
+    """({node: [best_score, best_path]}, set of nodes whose walk is proven optimal).
+
+    time_limit (seconds) covers building the bound, which gets at most
+    BOUND_SHARE of it, and the search. The search time is shared by all start
+    nodes, each one getting an even share of what is left when its turn comes.
+    Once time_limit is up the start nodes not searched yet are left out.
+    max_expansions applies per node."""
+    start_time = time.monotonic()
+    end_time = None if time_limit is None else start_time + time_limit
+    bound = WalkBound(csr, values, max_path_length,
+                      None if time_limit is None else start_time + time_limit * BOUND_SHARE).bound
+    starts = list(range(len(csr))) if starts is None else [csr.index[node] for node in starts]
+    indptr, indices = csr.indptr.tolist(), csr.indices.tolist()
+    values = values.tolist() if hasattr(values, 'tolist') else list(values)
+
+    best_paths = {}
+    proven = set()
+    for done, start in enumerate(starts):
+        deadline = None
+        if end_time is not None:
+            now = time.monotonic()
+            if now >= end_time:
+                break
+            deadline = now + (end_time - now) / (len(starts) - done)
+        result = _anytime_best_walk(indptr, indices, values, start, max_path_length, bound, deadline,
+                                    max_expansions)
+        if result is None:
+            continue
+        score, walk, optimal = result
+        node = csr.nodes[start]
+        best_paths[node] = [score, csr.to_nodes(walk)]
+        if optimal:
+            proven.add(node)
+    return best_paths, proven
@@ -0,0 +1,344 @@
+"""Benchmark the path enumeration and action planning strategies on synthetic road graphs.
+
+    python bench_disaster_response.py --graphs grid geometric --sizes 100 400 --lengths 4 6 8 --output bench.csv
+
+Road graphs are square grids, or random geometric graphs with --degree neighbors
+per node on average. Both have x/y/length like an OSMnx graph and a
+random_value on every node. Every strategy is timed (best of --repeat runs) and
+its peak Python memory measured with tracemalloc. quality is the best score
+over all start nodes (people saved for the action planners). The notebook's own
+functions are included as baselines, and skipped when they would enumerate
+more than --max-walks walks."""
+import argparse
+import csv
+import itertools
+import math
+import random
+import time
+import tracemalloc
+
+import networkx as nx
+import numpy as np
+
+from action_graph import action_times, site_distances
+from action_sequences import best_timed_sequences
+from anytime_search import anytime_best_paths
+from fleet_planner import plan_fleet
+from parallel_search import parallel_best_paths
+from path_scoring import batched, best_per_start, score_paths
+from path_search import CSRGraph, _iter_walks, best_paths
+from path_store import create_n_paths as create_path_store
+
+
+###
+## Synthetic road graphs
+###
+
+
+def finish_road_graph(graph, rng):
+    """Both directions of every edge with its length, a random_value and an elevation on every node."""
+    road = nx.MultiDiGraph()
+    for node, data in graph.nodes(data=True):
+        road.add_node(node, x=data['x'], y=data['y'], random_value=rng.randint(0, 9),
+                      elevation=rng.uniform(0, 15))
+    for u, v in graph.edges():
+        length = math.hypot(graph.nodes[u]['x'] - graph.nodes[v]['x'], graph.nodes[u]['y'] - graph.nodes[v]['y'])
+        road.add_edge(u, v, length=length)
+        road.add_edge(v, u, length=length)
+    return road
+
+
+def grid_road_graph(n_nodes, block=100.0, seed=0):
+    """A square grid of about n_nodes intersections, block meters apart."""
+    rng = random.Random(seed)
+    side = max(2, int(round(math.sqrt(n_nodes))))
+    grid = nx.convert_node_labels_to_integers(nx.grid_2d_graph(side, side), label_attribute='cell')
+    for node, data in grid.nodes(data=True):
+        data['x'], data['y'] = data['cell'][0] * block, data['cell'][1] * block
+    return finish_road_graph(grid, rng)
+
+
+def geometric_road_graph(n_nodes, degree=3.0, extent=3000.0, seed=0):
+    """n_nodes scattered over an extent x extent meter square, linked to the ones within
+    the radius that gives `degree` neighbors on average."""
+    rng = random.Random(seed)
+    radius = math.sqrt(degree / (math.pi * n_nodes))
+    graph = nx.random_geometric_graph(n_nodes, radius, seed=seed)
+    for node, data in graph.nodes(data=True):
+        data['x'], data['y'] = data['pos'][0] * extent, data['pos'][1] * extent
+    return finish_road_graph(graph, rng)
+
+
+GRAPHS = {'grid': grid_road_graph, 'geometric': geometric_road_graph}
+
+
+###
+## The notebook's implementations, as baselines
+###
+
+
+def notebook_find_paths(graph, current_node, moves_remaining, final_paths, path=None):
+    if moves_remaining <= 0:
+        final_paths.append(path)
+        return
+    moves_remaining -= 1
+    if path is None:
+        path = [current_node]
+    for next_node in graph[current_node]:
+        new_path = list(path)
+        new_path.append(next_node)
+        notebook_find_paths(graph, next_node, moves_remaining, final_paths, new_path)
+
+
+def notebook_create_n_paths(graph, max_path_length):
+    data = {node: [[[node]]] for node in graph.nodes()}
+    for length in range(1, max_path_length + 1):
+        for node in graph.nodes():
+            data[node].append([])
+            for next_node in graph[node]:
+                for path in data[next_node][length - 1]:
+                    data[node][length].append([node] + path)
+    return data
+
+
+def notebook_calc_score(graph, final_paths, score_attr):
+    scores = []
+    for path in final_paths:
+        values = nx.get_node_attributes(graph, score_attr)
+        score = 0
+        for node in path:
+            score += values[node]
+            values[node] = 0
+        scores.append(score)
+    return scores
+
+
+def notebook_recursion(graph, max_path_length):
+    best = {}
+    for node in graph.nodes():
+        final_paths = []
+        notebook_find_paths(graph, node, max_path_length, final_paths)
+        if final_paths:
+            scores = notebook_calc_score(graph, final_paths, 'random_value')
+            i = int(np.argmax(scores))
+            best[node] = [scores[i], final_paths[i]]
+    return best
+
+
+def notebook_memoization(graph, max_path_length):
+    path_data = notebook_create_n_paths(graph, max_path_length)
+    best = {}
+    for node in graph.nodes():
+        possible_paths = path_data[node][max_path_length]
+        if possible_paths:
+            scores = notebook_calc_score(graph, possible_paths, 'random_value')
+            i = int(np.argmax(scores))
+            best[node] = [scores[i], possible_paths[i]]
+    return best
+
+
+def notebook_timed_action_sequences(graph, max_time):
+    data = {node: {0: [[node]]} for node in graph.nodes()}
+    for time_available in range(1, max_time):
+        for node in graph.nodes():
+            for next_node in graph[node]:
+                time_of_step = int(round(graph[node][next_node]['transition_time'], 0))
+                time_check = time_available - time_of_step
+                for path in data[next_node].get(time_check, ()):
+                    if node not in path:
+                        data[node].setdefault(time_of_step + time_check, []).append([node] + path)
+    return data
+
+
+def notebook_best_action_sequences(graph, valid_actions, max_time):
+    best = {}
+    for node, sequences in notebook_timed_action_sequences(graph, max_time).items():
+        saved = [sum(valid_actions[site]['save_num_people'] for site in sequence)
+                 for sequence in sequences[max(sequences)]]
+        i = int(np.argmax(saved))
+        best[node] = [saved[i], sequences[max(sequences)][i]]
+    return best
+
+
+###
+## Running the benchmark
+###
+
+
+def measure(func, repeat):
+    """Best wall time over `repeat` runs and the peak traced memory of one run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def walk_count(csr, length):
+    """Number of walks of `length` moves from all nodes, what the exhaustive strategies enumerate."""
+    counts = np.ones(len(csr))
+    sources = np.repeat(np.arange(len(csr)), csr.degrees())
+    for _ in range(length):
+        counts = np.bincount(sources, weights=counts[csr.indices], minlength=len(csr))
+    return int(counts.sum())
+
+
+def best_score(best):
+    return max((score for score, _ in best.values()), default=0)
+
+
+def batch_scored_paths(csr, values, length):
+    """{start index: best score} from every walk enumerated into arrays and scored with score_paths."""
+    indptr, indices = csr.indptr.tolist(), csr.indices.tolist()
+    walks = itertools.chain.from_iterable(_iter_walks(indptr, indices, start, length) for start in range(len(csr)))
+    best = {}
+    for batch in batched(walks, length):
+        scores = score_paths(batch, values)
+        for start, row in best_per_start(batch, scores).items():
+            # Batches follow the enumeration order, an equal score later on doesn't replace the first
+            if start not in best or scores[row] > best[start]:
+                best[start] = scores[row]
+    return best
+
+
+def walk_strategies(graph, csr, values, length, time_budgets, max_walks, max_streamed_walks=None):
+    """(strategy, budget, function returning (quality, proven)) for the best-walk problem."""
+    steps = []
+    walks = walk_count(csr, length)
+    if walks <= max_walks:
+        steps += [
+            ('notebook recursion', None, lambda: (best_score(notebook_recursion(graph, length)), True)),
+            ('notebook memoization', None, lambda: (best_score(notebook_memoization(graph, length)), True)),
+            ('path store', None, lambda: (best_score(create_path_store(csr, length).best_paths(values)), True)),
+        ]
+    if max_streamed_walks is None or walks <= max_streamed_walks:
+        steps += [
+            ('streaming top-k', None, lambda: (best_score(best_paths(csr, values, length)), True)),
+            ('batch scoring', None, lambda: (
+                max(batch_scored_paths(csr, values, length).values(), default=0), True)),
+            # Peak memory is the parent process only, the workers' isn't traced
+            ('parallel top-k', None, lambda: (best_score(parallel_best_paths(csr, values, length)), True)),
+        ]
+
+    def anytime(budget):
+        best, proven = anytime_best_paths(csr, values, length, time_limit=budget)
+        return best_score(best), len(proven) == len(best)
+
+    steps.append(('anytime branch and bound', None, lambda: anytime(None)))
+    for budget in time_budgets:
+        steps.append(('anytime branch and bound', budget, lambda budget=budget: anytime(budget)))
+    return steps
+
+
+def action_problem(graph, n_sites, seed):
+    """Random action sites on graph as (G2, valid_actions, sites, times, people), like add_node_actions."""
+    rng = random.Random(seed)
+    sites = rng.sample(list(graph.nodes()), min(n_sites, len(graph)))
+    valid_actions = {}
+    for site in sites:
+        num_people = rng.randint(1, 4)
+        valid_actions[site] = {'node': site, 'save_num_people': num_people, 'time_to_save': num_people * 20}
+    times = action_times(site_distances(graph, sites), sites, valid_actions)
+    action_graph = nx.Graph()
+    action_graph.add_nodes_from(sites)
+    for i, site in enumerate(sites):
+        for j, next_site in enumerate(sites):
+            if np.isfinite(times[i, j]):
+                action_graph.add_edge(site, next_site, transition_time=times[i, j], action_id=next_site)
+    people = np.array([valid_actions[site]['save_num_people'] for site in sites])
+    # Same times as the notebook sees through the undirected G2, rounded to minutes
+    graph_times = np.full(times.shape, np.inf)
+    index = {site: i for i, site in enumerate(sites)}
+    for u, v, time_of_step in action_graph.edges(data='transition_time'):
+        graph_times[index[u], index[v]] = graph_times[index[v], index[u]] = round(time_of_step)
+    np.fill_diagonal(graph_times, np.inf)
+    return action_graph, valid_actions, sites, graph_times, people
+
+
+def label_setting(sites, times, people, max_time, time_limit):
+    """(quality, proven) of best_timed_sequences, proven unless it used up its time_limit."""
+    start = time.monotonic()
+    quality = best_score(best_timed_sequences(sites, times, people, max_time, time_limit=time_limit))
+    return quality, time_limit is None or time.monotonic() - start < time_limit
+
+
+def action_strategies(graph, n_sites, max_time, responders, notebook_sites, seed, label_time_limit=None):
+    action_graph, valid_actions, sites, times, people = action_problem(graph, n_sites, seed)
+    steps = []
+    if n_sites <= notebook_sites:
+        steps.append(('notebook timed sequences', max_time, lambda: (
+            best_score(notebook_best_action_sequences(action_graph, valid_actions, max_time)), True)))
+    steps.append(('label setting', max_time, lambda: label_setting(sites, times, people, max_time - 1,
+                                                                   label_time_limit)))
+    for k in responders:
+        steps.append(('fleet planner x{}'.format(k), max_time, lambda k=k: (
+            plan_fleet(sites, times, people, max_time - 1, k)[0], False)))
+    return steps
+
+
+def run(graphs, sizes, lengths, time_budgets=(), degree=3.0, repeat=1, max_walks=200000,
+        action_sites=(), max_time=200, responders=(1, 2), notebook_sites=8, label_time_limit=None,
+        max_streamed_walks=None, seed=0):
+    rows = []
+    for kind in graphs:
+        for n_nodes in sizes:
+            graph = GRAPHS[kind](n_nodes, seed=seed) if kind == 'grid' else \
+                GRAPHS[kind](n_nodes, degree=degree, seed=seed)
+            csr = CSRGraph.from_networkx(graph)
+            values = csr.node_values(graph, 'random_value')
+            problems = [('walk length', length, walk_strategies(graph, csr, values, length, time_budgets,
+                                                                 max_walks, max_streamed_walks))
+                        for length in lengths]
+            problems += [('action sites', n_sites, action_strategies(graph, n_sites, max_time, responders,
+                                                                     notebook_sites, seed, label_time_limit))
+                         for n_sites in action_sites]
+
+            for problem, size, steps in problems:
+                for name, budget, func in steps:
+                    seconds, peak, (quality, proven) = measure(func, repeat)
+                    rows.append({'graph': kind, 'nodes': len(graph), 'edges': graph.number_of_edges(),
+                                 'problem': problem, 'size': size, 'strategy': name, 'budget': budget,
+                                 'seconds': seconds, 'peak_bytes': peak, 'quality': quality, 'proven': proven})
+                    print('{:<9} {:>6} nodes  {:<12} {:>4}  {:<26} {:>6} {:>10.2f} ms {:>10.1f} KiB  quality {}'.format(
+                        kind, len(graph), problem, size, name, '' if budget is None else budget,
+                        seconds * 1000, peak / 1024, quality))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--graphs', nargs='+', choices=sorted(GRAPHS), default=['grid', 'geometric'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 400])
+    parser.add_argument('--degree', type=float, default=3.0, help='average degree of the geometric graphs')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[4, 6, 8], help='walk lengths in moves')
+    parser.add_argument('--time-budgets', type=float, nargs='*', default=[0.1, 1.0],
+                        help='seconds given to the anytime search')
+    parser.add_argument('--max-walks', type=int, default=200000,
+                        help='skip the exhaustive strategies above this many walks')
+    parser.add_argument('--max-streamed-walks', type=int, default=50000000,
+                        help='skip the streaming top-k search above this many walks')
+    parser.add_argument('--action-sites', type=int, nargs='*', default=[8, 15],
+                        help='numbers of action sites, label setting blows up on grids beyond ~20')
+    parser.add_argument('--max-time', type=int, default=200, help='minutes available to the responders')
+    parser.add_argument('--responders', type=int, nargs='*', default=[1, 2, 5])
+    parser.add_argument('--notebook-sites', type=int, default=8,
+                        help='largest number of action sites to run create_timed_action_sequences on')
+    parser.add_argument('--label-time-limit', type=float, default=60,
+                        help='seconds given to the label setting search over all start sites')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this CSV file')
+    args = parser.parse_args()
+
+    results = run(args.graphs, args.sizes, args.lengths, args.time_budgets, args.degree, args.repeat,
+                  args.max_walks, args.action_sites, args.max_time, args.responders, args.notebook_sites,
+                  args.label_time_limit, args.max_streamed_walks)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
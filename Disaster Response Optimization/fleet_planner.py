@@ -0,0 +1,194 @@
+"""Action sequences for several responders at once.
+
+The notebook pairs every node's single best sequence with every other and scores
+each union, which is quadratic in the number of sites and only ever considers
+two responders. Here k responders are planned over the action graph as arrays
+(see action_sequences.action_arrays or action_graph.action_times):
+
+  1. Greedy: responders are planned one after another, each on the people not
+     already reached by the earlier ones. A sequence is grown by cheapest
+     insertion, adding the site with the most people per extra minute at its
+     best position until nothing more fits in max_time.
+  2. Local search: sites are reordered within a sequence to free up time,
+     moved between responders, dropped and replaced with unreached ones, as
+     long as the total number of people saved goes up.
+
+Every insertion is scored for all positions and candidate sites at once with NumPy.
+
+    sites, times, people = action_arrays(G2, valid_actions)
+    total_saved, routes = plan_fleet(sites, times, people, max_time=200, responders=5)
+"""
+import time
+
+import numpy as np
+
+
+class Fleet:
+    """Sequences of site indices being planned, with their times and the sites nobody reaches yet."""
+
+    def __init__(self, times, people, max_time, start_times=None):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.people = np.asarray(people, dtype=np.float64)
+        self.max_time = max_time
+        n = len(self.people)
+        self.start_times = np.zeros(n) if start_times is None else np.asarray(start_times, dtype=np.float64)
+        self.routes = []
+        self.free = np.ones(n, dtype=bool)
+
+    def route_time(self, route):
+        if not route:
+            return 0.0
+        route = np.asarray(route)
+        return float(self.start_times[route[0]] + self.times[route[:-1], route[1:]].sum())
+
+    def route_saved(self, route):
+        return float(self.people[route].sum()) if route else 0.0
+
+    @property
+    def saved(self):
+        return sum(self.route_saved(route) for route in self.routes)
+
+    def best_insertion(self, route, candidates):
+        """(site, position, extra time) of the best people-per-minute insertion into route, or None."""
+        if not len(candidates):
+            return None
+        time_left = self.max_time - self.route_time(route)
+        people = self.people[candidates]
+        if not route:
+            extra = self.start_times[candidates][None, :]
+        else:
+            route = np.asarray(route)
+            first, last = route[0], route[-1]
+            # Row p is inserting before route[p], the last row appending after the last site
+            rows = [self.start_times[candidates] + self.times[candidates, first] - self.start_times[first]]
+            if len(route) > 1:
+                before, after = route[:-1], route[1:]
+                rows.extend(self.times[before][:, candidates] + self.times[candidates][:, after].T
+                            - self.times[before, after][:, None])
+            rows.append(self.times[last, candidates])
+            extra = np.vstack(rows)
+        feasible = extra <= time_left
+        if not feasible.any():
+            return None
+        rate = np.where(feasible, people[None, :] / np.maximum(extra, 1e-9), -np.inf)
+        position, column = np.unravel_index(np.argmax(rate), rate.shape)
+        return int(candidates[column]), int(position), float(extra[position, column])
+
+    def fill(self, route, allowed=None):
+        """Insert free sites into route (in place) until none fits, returns the sites added."""
+        added = []
+        while True:
+            free = self.free if allowed is None else self.free & allowed
+            insertion = self.best_insertion(route, np.flatnonzero(free))
+            if insertion is None:
+                return added
+            site, position, _ = insertion
+            route.insert(position, site)
+            self.free[site] = False
+            added.append(site)
+
+    def greedy_route(self, n_seeds=16):
+        """Best of growing a sequence from each of the n_seeds free sites with the most people."""
+        best = []
+        free = np.flatnonzero(self.free)
+        seeds = free[np.argsort(-self.people[free], kind="stable")[:n_seeds]]
+        for seed in seeds.tolist():
+            if self.start_times[seed] > self.max_time:
+                continue
+            route = [seed]
+            self.free[seed] = False
+            added = self.fill(route)
+            self.free[added + [seed]] = True
+            if self.route_saved(route) > self.route_saved(best):
+                best = route
+        self.free[best] = False
+        return best
+
+    def try_move(self, a, position, b):
+        """Move routes[a][position] into route b at its best place, then refill route a. Keeps it if more people are saved."""
+        route_a, route_b = list(self.routes[a]), list(self.routes[b])
+        site = route_a.pop(position)
+        before = self.route_saved(self.routes[a]) + self.route_saved(self.routes[b])
+        allowed = np.zeros(len(self.free), dtype=bool)
+        allowed[site] = True
+        self.free[site] = True
+        added_b = self.fill(route_b, allowed)
+        if not added_b:
+            self.free[site] = False
+            return False
+        added_a = self.fill(route_a)
+        if self.route_saved(route_a) + self.route_saved(route_b) > before:
+            self.routes[a], self.routes[b] = route_a, route_b
+            return True
+        self.free[added_a] = True
+        self.free[site] = False
+        return False
+
+    def try_replace(self, a, position):
+        """Drop routes[a][position] and refill route a with free sites. Keeps it if more people are saved."""
+        route = list(self.routes[a])
+        site = route.pop(position)
+        before = self.route_saved(self.routes[a])
+        added = self.fill(route, self.free & (np.arange(len(self.free)) != site))
+        if self.route_saved(route) > before:
+            self.routes[a] = route
+            self.free[site] = True
+            # The site dropped may fit elsewhere now
+            for other in self.routes:
+                self.fill(other)
+            return True
+        self.free[added] = True
+        return False
+
+    def try_shorten(self, a):
+        """Move each site of route a to its cheapest place in the route, then refill the time saved."""
+        route = self.routes[a]
+        shortened = False
+        for position in range(len(route)):
+            rest = route[:position] + route[position + 1:]
+            site = route[position]
+            _, new_position, extra = self.best_insertion(rest, np.array([site])) or (None, None, np.inf)
+            if self.route_time(rest) + extra < self.route_time(route) - 1e-9:
+                route = rest[:new_position] + [site] + rest[new_position:]
+                shortened = True
+        if not shortened:
+            return False
+        self.routes[a] = route
+        return bool(self.fill(route))
+
+    def improve(self, deadline=None):
+        """Local search until no move improves the plan or the deadline passes."""
+        improved = True
+        while improved:
+            improved = False
+            for a in range(len(self.routes)):
+                if self.try_shorten(a):
+                    improved = True
+                for position in range(len(self.routes[a]) - 1, -1, -1):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        return
+                    if position >= len(self.routes[a]):
+                        continue
+                    if self.try_replace(a, position):
+                        improved = True
+                        continue
+                    for b in range(len(self.routes)):
+                        if b != a and len(self.routes[a]) > 1 and self.try_move(a, position, b):
+                            improved = True
+                            break
+
+
+def plan_fleet(sites, times, people, max_time, responders, start_times=None, n_seeds=16, time_limit=None):
+    """(total people saved, [(people saved, time used, [site ids]), ...] per responder).
+
+    Responders may start at any site, start_times[i] being the time spent before
+    leaving site i (0, as in the notebook, when not given). time_limit bounds the
+    local search in seconds, the greedy plan is always completed."""
+    start = time.monotonic()
+    fleet = Fleet(times, people, max_time, start_times)
+    for _ in range(responders):
+        fleet.routes.append(fleet.greedy_route(n_seeds))
+    fleet.improve(None if time_limit is None else start + time_limit)
+    routes = [(fleet.route_saved(route), fleet.route_time(route), [sites[i] for i in route])
+              for route in fleet.routes]
+    return fleet.saved, routes
@@ -0,0 +1,161 @@
+"""Best walk search over all start nodes on every core, with checkpoint and resume.
+
+Start nodes are independent, so they are spread over a process pool. The CSR
+arrays and node values are copied once into shared memory, and the workers map
+them instead of each receiving a pickled copy of the graph. Every finished
+start node is appended to a checkpoint file straight away (one JSON object per
+line), so an interrupted run picks up where it stopped. The checkpoint's first
+line records the settings and a hash of the graph and values, a checkpoint
+written for anything else is discarded.
+
+    best_paths = parallel_best_paths(csr, values, 10, checkpoint="best_paths.jsonl")
+"""
+import hashlib
+import json
+import os
+from multiprocessing import Pool, cpu_count, shared_memory
+
+import numpy as np
+
+from path_search import _top_k_walks
+
+
+def share_arrays(arrays):
+    """Copy {name: array} into shared memory blocks. Returns the blocks and a picklable spec to attach them."""
+    blocks = []
+    spec = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+
+def attach_arrays(spec):
+    """Map the blocks of a share_arrays spec, returns the blocks and {name: array}."""
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+# Set in every worker by init_worker
+_worker = {}
+
+
+def init_worker(spec, max_path_length, k):
+    blocks, arrays = attach_arrays(spec)
+    n = len(arrays['indptr']) - 1
+    # The walk loop indexes lists much faster than arrays, convert once per worker
+    _worker.update(
+        blocks=blocks,
+        indptr=arrays['indptr'].tolist(),
+        indices=arrays['indices'].tolist(),
+        values=arrays['values'].tolist(),
+        max_path_length=max_path_length,
+        k=k,
+        counts=[0] * n,
+    )
+
+
+def search_start(start):
+    """Top-k walks from one start node (CSR index), run inside a worker."""
+    top = _top_k_walks(_worker['indptr'], _worker['indices'], _worker['values'], start,
+                       _worker['max_path_length'], _worker['k'], _worker['counts'])
+    return start, top
+
+
+def arrays_hash(*arrays):
+    """Hex digest of the dtype, shape and contents of arrays."""
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update('{}{}'.format(array.dtype.str, array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def read_checkpoint(checkpoint, settings):
+    """{node: [[score, path], ...]} already in checkpoint, or None if it was written with other settings."""
+    results = {}
+    if not os.path.exists(checkpoint):
+        return results
+    with open(checkpoint) as f:
+        lines = f.read().split('\n')
+    if not lines[0]:
+        return results
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        return None
+    if header != settings:
+        return None
+    for line in lines[1:]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # The last line is cut short if the run was killed while writing it
+            continue
+        results[record['node']] = record['walks']
+    return results
+
+
+def parallel_best_walks(csr, values, max_path_length, k=1, checkpoint=None, processes=None,
+                        chunksize=16, verbose=False):
+    """{node: [[score, path], ...]} with the k best walks from every node, computed on `processes` cores.
+
+    With a checkpoint file, nodes already in it are skipped and each new result
+    is appended as soon as it arrives. A checkpoint of another graph, other
+    values or other settings is deleted and the search starts over."""
+    values = np.asarray(values)
+    settings = {'max_path_length': max_path_length, 'k': k, 'nodes': len(csr),
+                'hash': arrays_hash(csr.indptr, csr.indices, values)}
+    results = read_checkpoint(checkpoint, settings) if checkpoint else {}
+    if results is None:
+        os.remove(checkpoint)
+        results = {}
+    todo = [i for i, node in enumerate(csr.nodes) if node not in results]
+    if not todo:
+        return results
+
+    blocks, spec = share_arrays({'indptr': csr.indptr, 'indices': csr.indices, 'values': values})
+    out = None
+    try:
+        if checkpoint:
+            out = open(checkpoint, 'a+')
+            out.seek(0, os.SEEK_END)
+            if not out.tell():
+                out.write(json.dumps(settings) + '\n')
+            else:
+                # Start a fresh line after a record cut short by the interruption
+                out.seek(out.tell() - 1)
+                if out.read(1) != '\n':
+                    out.write('\n')
+        with Pool(processes or cpu_count(), init_worker, (spec, max_path_length, k)) as pool:
+            for done, (start, top) in enumerate(pool.imap_unordered(search_start, todo, chunksize), 1):
+                node = csr.nodes[start]
+                walks = [[score, csr.to_nodes(walk)] for score, walk in top]
+                results[node] = walks
+                if out:
+                    out.write(json.dumps({'node': node, 'walks': walks}) + '\n')
+                    out.flush()
+                if verbose and done % 100 == 0:
+                    print(str(round(done / len(todo) * 100, 2)) + "% done")
+    finally:
+        if out:
+            out.close()
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return results
+
+
+def parallel_best_paths(csr, values, max_path_length, **kwargs):
+    """Same format as the notebook's best_paths: {node: [best_score, best_path]}."""
+    results = parallel_best_walks(csr, values, max_path_length, 1, **kwargs)
+    return {node: walks[0] for node, walks in results.items() if walks}
@@ -0,0 +1,73 @@
+"""Batch scoring of many walks at once with NumPy.
+
+calc_score looks up the node attributes again for every path and adds them up
+one node at a time. Here a batch of walks is a 2-D int array, one walk of CSR
+node indices (see path_search.CSRGraph) per row, and "count each node once" is
+done for every row together: sort each row, mask the entries equal to their left
+neighbour, sum the values of the rest.
+
+    values = csr.node_values(G, "random_value")
+    scores = score_paths(paths_to_array(csr, final_paths), values)
+"""
+import itertools
+
+import numpy as np
+
+# Rows scored per chunk, bounds the temporary arrays to a few hundred MB for long walks
+CHUNK_ROWS = 1 << 20
+
+
+def paths_to_array(csr, paths):
+    """The notebook's list of node id paths as an (n_paths, length + 1) array of CSR indices."""
+    index = csr.index
+    return np.array([[index[node] for node in path] for path in paths], dtype=np.int32)
+
+
+def first_visits(paths):
+    """Row-sorted copy of paths and a mask of the first occurrence of each node in its row."""
+    ordered = np.sort(paths, axis=1)
+    first = np.ones(ordered.shape, dtype=bool)
+    first[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    return ordered, first
+
+
+def score_paths(paths, values, chunk_rows=CHUNK_ROWS):
+    """Sum of values over the distinct nodes of every row of paths, like calc_score."""
+    paths = np.asarray(paths)
+    values = np.asarray(values)
+    if paths.ndim != 2:
+        raise ValueError('paths must be a 2-D array, one walk per row')
+    scores = np.empty(len(paths), dtype=values.dtype)
+    for start in range(0, len(paths), chunk_rows):
+        ordered, first = first_visits(paths[start:start + chunk_rows])
+        scores[start:start + chunk_rows] = np.where(first, values[ordered], 0).sum(axis=1)
+    return scores
+
+
+def distinct_counts(paths):
+    """Number of distinct nodes on every row of paths."""
+    return first_visits(np.asarray(paths))[1].sum(axis=1)
+
+
+def best_per_start(paths, scores):
+    """{start index: row of its best scoring walk}, ties going to the first row like np.argmax."""
+    paths = np.asarray(paths)
+    scores = np.asarray(scores)
+    if not len(paths):
+        return {}
+    rows = np.arange(len(paths))
+    # Group by start node, best score first, earliest row first among equals
+    order = np.lexsort((rows, -scores, paths[:, 0]))
+    starts = paths[order, 0]
+    heads = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    return dict(zip(starts[heads].tolist(), order[heads].tolist()))
+
+
+def batched(walks, length, batch_rows=CHUNK_ROWS):
+    """Group an iterator of walks (e.g. path_search.iter_walks) into 2-D arrays of batch_rows rows."""
+    walks = iter(walks)
+    while True:
+        batch = list(itertools.islice(walks, batch_rows))
+        if not batch:
+            return
+        yield np.array(batch, dtype=np.int32).reshape(len(batch), length + 1)
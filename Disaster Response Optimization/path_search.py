@@ -0,0 +1,183 @@
+"""Walk enumeration over an integer CSR copy of a road graph.
+
+The notebook's findPaths copies the path at every step and keeps every walk of
+max_path_length in final_paths before calc_score picks the best one. Here the
+graph is turned into integer arrays once, walks are enumerated iteratively as a
+generator, and the search keeps a running "count each node once" score so only
+a top-k heap per start node is held in memory: O(k + depth) instead of O(paths).
+
+    csr = CSRGraph.from_networkx(G)
+    values = csr.node_values(G, "random_value")
+    best_paths = best_walks(csr, values, max_path_length=10)
+"""
+import heapq
+
+import numpy as np
+
+
+class CSRGraph:
+    """Adjacency of a networkx graph as integer arrays.
+
+    Nodes are renumbered 0..n-1 in graph.nodes() order. indices[indptr[i]:indptr[i+1]]
+    are the neighbors of node i, in the same order as graph[node] iterates them,
+    with parallel edges of a multigraph collapsed like graph[node] does."""
+
+    def __init__(self, indptr, indices, nodes):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.nodes = list(nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+
+    @classmethod
+    def from_networkx(cls, graph, nodes=None):
+        nodes = list(graph.nodes()) if nodes is None else list(nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        indices = []
+        for i, node in enumerate(nodes):
+            neighbors = [index[next_node] for next_node in graph[node] if next_node in index]
+            indices.extend(neighbors)
+            indptr[i + 1] = indptr[i] + len(neighbors)
+        return cls(indptr, indices, nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def neighbors(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def node_values(self, graph, attr, default=0):
+        """Array of a node attribute in CSR order, e.g. "random_value"."""
+        import networkx as nx
+
+        values = nx.get_node_attributes(graph, attr)
+        return np.array([values.get(node, default) for node in self.nodes])
+
+    def to_nodes(self, path):
+        """Translate a walk of CSR indices back to the graph's node ids."""
+        return [self.nodes[i] for i in path]
+
+
+def iter_walks(csr, start, length):
+    """Yield every walk of `length` moves from start, as a tuple of CSR indices.
+
+    Nodes may be revisited, as in findPaths. Walks come out in the same order
+    findPaths appends them to final_paths, one at a time."""
+    return _iter_walks(csr.indptr.tolist(), csr.indices.tolist(), start, length)
+
+
+def _iter_walks(indptr, indices, start, length):
+    """iter_walks over the CSR arrays as lists, for callers walking from many starts."""
+    if length <= 0:
+        yield (start,)
+        return
+    path = [start] * (length + 1)
+    cursor = [0] * length
+    end = [0] * length
+    depth = 0
+    cursor[0], end[0] = indptr[start], indptr[start + 1]
+    while depth >= 0:
+        if cursor[depth] == end[depth]:
+            depth -= 1
+            continue
+        next_node = indices[cursor[depth]]
+        cursor[depth] += 1
+        path[depth + 1] = next_node
+        if depth + 1 == length:
+            yield tuple(path)
+        else:
+            depth += 1
+            cursor[depth], end[depth] = indptr[next_node], indptr[next_node + 1]
+
+
+def top_k_walks(csr, start, length, values, k=1, counts=None):
+    """The k best walks of `length` moves from start, best first, as (score, walk) pairs.
+
+    A walk scores the sum of values of the distinct nodes it visits, like
+    calc_score. The score is kept up to date as the walk is extended and
+    shortened, so no walk is ever stored unless it enters the top-k heap.
+    Ties go to the walk enumerated first, matching np.argmax over final_paths.
+    counts is an optional scratch list of len(csr) zeros, reused across calls."""
+    values = values.tolist() if hasattr(values, 'tolist') else list(values)
+    if counts is None:
+        counts = [0] * len(csr)
+    return _top_k_walks(csr.indptr.tolist(), csr.indices.tolist(), values, start, length, k, counts)
+
+
+def _top_k_walks(indptr, indices, values, start, length, k, counts):
+    """top_k_walks over the CSR arrays and values as lists, converted once by the caller."""
+    # Min-heap of (score, -sequence number, walk), the worst kept walk on top
+    heap = []
+    sequence = 0
+
+    def offer(score, walk):
+        nonlocal sequence
+        entry = (score, -sequence, walk)
+        sequence += 1
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    path = [start] * (length + 1)
+    counts[start] += 1
+    score = values[start]
+    if length <= 0:
+        offer(score, (start,))
+    else:
+        cursor = [0] * length
+        end = [0] * length
+        depth = 0
+        cursor[0], end[0] = indptr[start], indptr[start + 1]
+        while True:
+            if cursor[depth] < end[depth]:
+                next_node = indices[cursor[depth]]
+                cursor[depth] += 1
+                if counts[next_node] == 0:
+                    score += values[next_node]
+                counts[next_node] += 1
+                path[depth + 1] = next_node
+                if depth + 1 == length:
+                    offer(score, tuple(path))
+                    counts[next_node] -= 1
+                    if counts[next_node] == 0:
+                        score -= values[next_node]
+                else:
+                    depth += 1
+                    cursor[depth], end[depth] = indptr[next_node], indptr[next_node + 1]
+            else:
+                if depth == 0:
+                    break
+                # Step back, the node at this depth leaves the walk
+                node = path[depth]
+                counts[node] -= 1
+                if counts[node] == 0:
+                    score -= values[node]
+                depth -= 1
+    counts[start] -= 1
+
+    return [(walk_score, list(walk)) for walk_score, _, walk in sorted(heap, reverse=True)]
+
+
+def best_walks(csr, values, max_path_length, k=1, starts=None):
+    """{node: [(score, [node ids]), ...]} with the k best walks from every start node."""
+    starts = range(len(csr)) if starts is None else [csr.index[node] for node in starts]
+    indptr, indices = csr.indptr.tolist(), csr.indices.tolist()
+    values = values.tolist() if hasattr(values, 'tolist') else list(values)
+    counts = [0] * len(csr)
+    results = {}
+    for start in starts:
+        top = _top_k_walks(indptr, indices, values, start, max_path_length, k, counts)
+        results[csr.nodes[start]] = [(score, csr.to_nodes(walk)) for score, walk in top]
+    return results
+
+
+def best_paths(csr, values, max_path_length, starts=None):
+    """Same format as the notebook's best_paths: {node: [best_score, best_path]}.
+
+    Nodes with no walk of that length (dead ends of the one-way street graph) are left out."""
+    return {node: list(top[0]) for node, top in best_walks(csr, values, max_path_length, 1, starts).items()
+            if top}
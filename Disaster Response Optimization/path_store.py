@@ -0,0 +1,143 @@
+"""Array-backed storage for the walks built by create_n_paths.
+
+create_n_paths keeps every walk of every length as a full Python list, [node] + path,
+so memory grows with length times the (exponential) number of walks. The
+same dynamic program is stored here as a prefix tree: a walk of length L is its
+head node plus a pointer to the walk of length L-1 it extends. Each walk costs
+one int32 head and one int32/int64 parent, whatever its length. Walks are
+rebuilt only when asked for, and scoring rebuilds them a chunk at a time.
+
+    store = create_n_paths(csr, max_path_length)
+    best_paths = store.best_paths(values)
+"""
+import numpy as np
+
+from path_scoring import CHUNK_ROWS, score_paths
+
+
+class PathLevel:
+    """All walks of one length: heads[i] is the first node of walk i and parents[i]
+    the walk of the previous level it continues with. Walks are grouped by head,
+    the walks starting at node u are offsets[u]:offsets[u + 1]."""
+
+    def __init__(self, heads, parents, offsets):
+        self.heads = heads
+        self.parents = parents
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.heads)
+
+    @property
+    def nbytes(self):
+        return self.heads.nbytes + self.parents.nbytes + self.offsets.nbytes
+
+
+def extend_level(csr, previous):
+    """The next level: every edge u -> v prepends u to each walk starting at v."""
+    n = len(csr)
+    sources = np.repeat(np.arange(n, dtype=np.int32), csr.degrees())
+    targets = csr.indices
+    counts = np.diff(previous.offsets)[targets]
+    total = int(counts.sum())
+
+    # parents are consecutive runs previous.offsets[v]:previous.offsets[v + 1], one run per edge
+    run_starts = np.cumsum(counts) - counts
+    parent_dtype = np.int32 if len(previous) < np.iinfo(np.int32).max else np.int64
+    parents = (np.arange(total, dtype=np.int64)
+               - np.repeat(run_starts, counts)
+               + np.repeat(previous.offsets[targets], counts)).astype(parent_dtype)
+    heads = np.repeat(sources, counts)
+
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(offsets, sources + 1, counts)
+    return PathLevel(heads, parents, np.cumsum(offsets))
+
+
+class PathStore:
+    """Every walk of length 0..max_path_length of a CSRGraph, in create_n_paths order."""
+
+    def __init__(self, csr, levels):
+        self.csr = csr
+        self.levels = levels
+
+    @property
+    def max_path_length(self):
+        return len(self.levels) - 1
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    def count(self, length, node=None):
+        """Number of walks of `length`, in total or starting at a node id."""
+        level = self.levels[length]
+        if node is None:
+            return len(level)
+        i = self.csr.index[node]
+        return int(level.offsets[i + 1] - level.offsets[i])
+
+    def walks(self, length, entries):
+        """The walks at entries of a level as a (len(entries), length + 1) array of CSR indices."""
+        entries = np.asarray(entries, dtype=np.int64)
+        walks = np.empty((len(entries), length + 1), dtype=np.int32)
+        for depth in range(length + 1):
+            level = self.levels[length - depth]
+            walks[:, depth] = level.heads[entries]
+            entries = level.parents[entries]
+        return walks
+
+    def path(self, length, entry):
+        """One walk as a list of node ids."""
+        return self.csr.to_nodes(self.walks(length, [entry])[0].tolist())
+
+    def paths_from(self, node, length=None):
+        """data[node][length] of create_n_paths: every walk of length from node, as node id lists."""
+        length = self.max_path_length if length is None else length
+        i = self.csr.index[node]
+        level = self.levels[length]
+        walks = self.walks(length, np.arange(level.offsets[i], level.offsets[i + 1]))
+        return [self.csr.to_nodes(walk) for walk in walks.tolist()]
+
+    def scores(self, values, length=None, chunk_rows=CHUNK_ROWS):
+        """Count-each-node-once score of every walk of length, rebuilt and scored chunk by chunk."""
+        length = self.max_path_length if length is None else length
+        values = np.asarray(values)
+        total = len(self.levels[length])
+        scores = np.empty(total, dtype=values.dtype)
+        for start in range(0, total, chunk_rows):
+            entries = np.arange(start, min(start + chunk_rows, total))
+            scores[start:start + len(entries)] = score_paths(self.walks(length, entries), values)
+        return scores
+
+    def best_entries(self, values, length=None, chunk_rows=CHUNK_ROWS):
+        """{CSR index: (best score, entry)} per start node, ties going to the first walk like np.argmax."""
+        length = self.max_path_length if length is None else length
+        level = self.levels[length]
+        scores = self.scores(values, length, chunk_rows)
+        nonempty = np.flatnonzero(np.diff(level.offsets))
+        if not len(nonempty):
+            return {}
+        starts = level.offsets[nonempty]
+        best = np.maximum.reduceat(scores, starts)
+        # First entry in each node's run that reaches the run's best score
+        hits = np.flatnonzero(scores == np.repeat(best, np.diff(level.offsets)[nonempty]))
+        first = hits[np.searchsorted(hits, starts)]
+        return {int(i): (score, int(entry)) for i, score, entry in zip(nonempty, best.tolist(), first)}
+
+    def best_paths(self, values, length=None, chunk_rows=CHUNK_ROWS):
+        """Same format as the notebook's best_paths: {node: [best_score, best_path]}."""
+        length = self.max_path_length if length is None else length
+        return {self.csr.nodes[i]: [score, self.path(length, entry)]
+                for i, (score, entry) in self.best_entries(values, length, chunk_rows).items()}
+
+
+def create_n_paths(csr, max_path_length):
+    """Build the PathStore of every walk up to max_path_length, bottom up like the notebook's create_n_paths."""
+    n = len(csr)
+    levels = [PathLevel(np.arange(n, dtype=np.int32),
+                        np.full(n, -1, dtype=np.int32),
+                        np.arange(n + 1, dtype=np.int64))]
+    for length in range(1, max_path_length + 1):
+        levels.append(extend_level(csr, levels[-1]))
+    return PathStore(csr, levels)
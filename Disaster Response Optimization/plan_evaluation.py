@@ -0,0 +1,127 @@
+"""Monte Carlo evaluation of action plans under uncertain travel and rescue times.
+
+create_timed_action_sequences takes travel at 15 minutes per kilometer and rescues
+at 20 minutes per person, always. Here both are random: every leg's travel time
+is its expected time times a lognormal factor, and each rescue takes a gamma
+distributed time around minutes_per_person per person. Thousands of scenarios
+are drawn at once, and every plan is run through every scenario as array
+operations. The same draws are used for every plan (common random numbers), so
+differences between plans are not sampling noise.
+
+    travel = distances / 1000 * MINUTES_PER_KM
+    results = evaluate_plans(plans, travel, people, max_time=200)
+    best_first = rank_plans(results, by="worst")
+"""
+import numpy as np
+
+# Minutes per person rescued, as assumed in add_node_actions
+MINUTES_PER_PERSON = 20
+
+# Scenarios evaluated per chunk, bounds the (scenarios, plans, sites) temporaries
+CHUNK_SCENARIOS = 500
+
+
+def pad_plans(plans):
+    """Plans of site indices as an (n_plans, longest) array padded with -1."""
+    longest = max((len(plan) for plan in plans), default=0)
+    padded = np.full((len(plans), longest), -1, dtype=np.int64)
+    for i, plan in enumerate(plans):
+        padded[i, :len(plan)] = plan
+    return padded
+
+
+def sample_scenarios(n_scenarios, n_sites, people, minutes_per_person=MINUTES_PER_PERSON,
+                     travel_sigma=0.25, rescue_shape=4.0, rng=None):
+    """(travel factors, rescue minutes), both (n_scenarios, n_sites).
+
+    travel_factors[s, j] scales the travel time of the leg arriving at site j. It
+    is lognormal with mean 1, so travel_sigma=0 gives the expected times.
+    rescue[s, j] is gamma with mean minutes_per_person * people[j], shape
+    rescue_shape (coefficient of variation 1 / sqrt(rescue_shape)). Either
+    parameter may be an array with one value per site."""
+    rng = np.random.default_rng(rng)
+    travel_sigma = np.broadcast_to(np.asarray(travel_sigma, dtype=np.float64), (n_sites,))
+    travel = rng.lognormal(-travel_sigma ** 2 / 2, travel_sigma, size=(n_scenarios, n_sites))
+    mean = minutes_per_person * np.asarray(people, dtype=np.float64)
+    shape = np.broadcast_to(np.asarray(rescue_shape, dtype=np.float64), (n_sites,))
+    rescue = rng.gamma(shape, mean / shape, size=(n_scenarios, n_sites))
+    return travel, rescue
+
+
+def completion_times(plans, travel, travel_factors, rescue, count_start=False):
+    """(n_scenarios, n_plans, longest) minutes at which each action of each plan is done, inf for padding.
+
+    The first site's rescue takes no time, as in create_timed_action_sequences
+    and plan_fleet without start_times, unless count_start is True."""
+    valid = plans >= 0
+    sites = np.where(valid, plans, 0)
+    # Expected travel of each leg, 0 to reach the first site
+    legs = np.zeros(plans.shape)
+    legs[:, 1:] = np.where(valid[:, 1:], travel[sites[:, :-1], sites[:, 1:]], 0)
+    steps = legs[None] * travel_factors[:, sites] + rescue[:, sites]
+    if not count_start and steps.shape[2]:
+        steps[:, :, 0] = 0
+    steps[:, ~valid] = 0
+    done = np.cumsum(steps, axis=2)
+    done[:, ~valid] = np.inf
+    return done
+
+
+def evaluate_plans(plans, travel, people, max_time, n_scenarios=2000, quantiles=(0.05, 0.5, 0.95),
+                   count_start=False, seed=0, sites=None, chunk_scenarios=CHUNK_SCENARIOS, **scenario_kwargs):
+    """Distribution of people saved within max_time and of completion time for every plan.
+
+    plans are sequences of site indices into travel (expected minutes between
+    sites, without rescue time) and people, or site ids when the list of sites
+    in that order is given. count_start=True counts the rescue at the first
+    site too. Returns a dict of arrays with one entry per plan: expected /
+    worst / quantiles of people saved, probability of finishing the whole plan
+    in time, expected and quantile completion times, and the raw 'saved'
+    samples, (n_plans, n_scenarios)."""
+    if sites is not None:
+        index = {site: i for i, site in enumerate(sites)}
+        plans = [[index[site] for site in plan] for plan in plans]
+    padded = pad_plans([list(plan) for plan in plans])
+    travel = np.asarray(travel, dtype=np.float64)
+    people = np.asarray(people, dtype=np.float64)
+    travel_factors, rescue = sample_scenarios(n_scenarios, len(people), people, rng=seed, **scenario_kwargs)
+
+    plan_people = np.where(padded >= 0, people[np.where(padded >= 0, padded, 0)], 0)
+    lengths = (padded >= 0).sum(axis=1)
+    saved = np.empty((len(padded), n_scenarios))
+    finish = np.zeros((len(padded), n_scenarios))
+    for start in range(0, n_scenarios, chunk_scenarios):
+        chunk = slice(start, start + chunk_scenarios)
+        done = completion_times(padded, travel, travel_factors[chunk], rescue[chunk], count_start)
+        saved[:, chunk] = ((done <= max_time) * plan_people[None]).sum(axis=2).T
+        if padded.shape[1]:
+            finish[:, chunk] = np.take_along_axis(
+                done, np.maximum(lengths - 1, 0)[None, :, None], axis=2)[:, :, 0].T
+        finish[lengths == 0, chunk] = 0
+
+    quantiles = np.asarray(quantiles)
+    return {
+        'expected_saved': saved.mean(axis=1),
+        'worst_saved': saved.min(axis=1),
+        'saved_quantiles': np.quantile(saved, quantiles, axis=1).T,
+        'on_time': (finish <= max_time).mean(axis=1),
+        'expected_finish': finish.mean(axis=1),
+        'finish_quantiles': np.quantile(finish, quantiles, axis=1).T,
+        'quantiles': quantiles,
+        'saved': saved,
+    }
+
+
+def rank_plans(results, by='expected', quantile=0):
+    """Plan indices best first, by 'expected' people saved, the 'worst' case or a saved quantile's index.
+
+    Ties are broken by the expected time to finish."""
+    if by == 'expected':
+        key = results['expected_saved']
+    elif by == 'worst':
+        key = results['worst_saved']
+    elif by == 'quantile':
+        key = results['saved_quantiles'][:, quantile]
+    else:
+        raise ValueError("by must be 'expected', 'worst' or 'quantile', not {!r}".format(by))
+    return np.lexsort((results['expected_finish'], -key))
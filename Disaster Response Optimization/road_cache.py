@@ -0,0 +1,277 @@
+"""Offline copy of the road network, with elevations, and fast bounding box subgraphs.
+
+The notebook downloads Corpus Christi from OpenStreetMap and asks the Google
+elevation API for every node on each run. Here the network is saved once with
+its elevations and edge grades as plain arrays in an .npz, and later runs load
+it with no network access at all. Elevations come from a provider, any
+callable elevations(lats, lons); providers reading a local raster or CSV of
+samples are included, so not even the first run needs the elevation API.
+
+Nodes are kept in a grid spatial index, so truncating to a bounding box looks
+at the grid cells the box covers rather than at every node of the city.
+
+    network = load_road_network("Corpus Christi, Texas", "corpus_christi.npz",
+                                elevation=RasterElevation.from_file("elevation.npz"))
+    G = network.bbox_subgraph(*bbox_from_point((27.7006, -97.3964), distance=1000))
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+NODE_ATTRS = ('x', 'y', 'elevation')
+EDGE_ATTRS = ('length', 'grade', 'grade_abs')
+
+EARTH_RADIUS = 6371009
+
+
+def bbox_from_point(point, distance=1000):
+    """(north, south, east, west) of the box `distance` meters around (lat, lon), like ox.bbox_from_point."""
+    lat, lon = point
+    delta_lat = math.degrees(distance / EARTH_RADIUS)
+    delta_lon = delta_lat / math.cos(math.radians(lat))
+    return lat + delta_lat, lat - delta_lat, lon + delta_lon, lon - delta_lon
+
+
+class SpatialIndex:
+    """Points bucketed into a regular lat/lon grid, sorted by cell.
+
+    The points of cell c are order[cell_starts[c]:cell_starts[c + 1]]."""
+
+    def __init__(self, lats, lons, cell_size=0.005):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.cell_size = cell_size
+        if len(self.lats):
+            self.south, self.west = self.lats.min(), self.lons.min()
+            self.rows = int((self.lats.max() - self.south) // cell_size) + 1
+            self.cols = int((self.lons.max() - self.west) // cell_size) + 1
+        else:
+            self.south = self.west = 0.0
+            self.rows = self.cols = 0
+        cells = self.cell(self.lats, self.lons)
+        self.order = np.argsort(cells, kind='stable')
+        self.cell_starts = np.searchsorted(cells[self.order], np.arange(self.rows * self.cols + 1))
+
+    def cell(self, lats, lons):
+        row = np.clip(((lats - self.south) // self.cell_size).astype(np.int64), 0, max(self.rows - 1, 0))
+        col = np.clip(((lons - self.west) // self.cell_size).astype(np.int64), 0, max(self.cols - 1, 0))
+        return row * self.cols + col
+
+    def cell_points(self, rows, cols):
+        """Indices of the points in the grid cells of rows x cols."""
+        cells = (np.asarray(rows)[:, None] * self.cols + np.asarray(cols)[None, :]).ravel()
+        starts, ends = self.cell_starts[cells], self.cell_starts[cells + 1]
+        if not len(cells) or not (ends - starts).sum():
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.order[start:end] for start, end in zip(starts, ends) if end > start])
+
+    def in_bbox(self, north, south, east, west):
+        """Indices of the points inside the box, borders included."""
+        if not self.rows:
+            return np.zeros(0, dtype=np.int64)
+        first_row = max(0, int((south - self.south) // self.cell_size))
+        last_row = min(self.rows - 1, int((north - self.south) // self.cell_size))
+        first_col = max(0, int((west - self.west) // self.cell_size))
+        last_col = min(self.cols - 1, int((east - self.west) // self.cell_size))
+        if first_row > last_row or first_col > last_col:
+            return np.zeros(0, dtype=np.int64)
+        candidates = self.cell_points(np.arange(first_row, last_row + 1), np.arange(first_col, last_col + 1))
+        lats, lons = self.lats[candidates], self.lons[candidates]
+        inside = (lats <= north) & (lats >= south) & (lons <= east) & (lons >= west)
+        return np.sort(candidates[inside])
+
+    def nearest(self, lat, lon):
+        """Index of the point closest to (lat, lon) in degrees, searching rings of cells outwards."""
+        row = int(np.clip((lat - self.south) // self.cell_size, 0, self.rows - 1))
+        col = int(np.clip((lon - self.west) // self.cell_size, 0, self.cols - 1))
+        best, best_distance = -1, np.inf
+        for ring in range(max(self.rows, self.cols)):
+            # Every point further out is at least (ring - 1) cells away
+            if (ring - 1) * self.cell_size > best_distance:
+                break
+            rows = np.arange(max(0, row - ring), min(self.rows, row + ring + 1))
+            cols = np.arange(max(0, col - ring), min(self.cols, col + ring + 1))
+            candidates = self.cell_points(rows, cols)
+            if not len(candidates):
+                continue
+            distances = np.hypot(self.lats[candidates] - lat, self.lons[candidates] - lon)
+            i = int(np.argmin(distances))
+            if distances[i] < best_distance:
+                best, best_distance = int(candidates[i]), distances[i]
+        return best
+
+
+###
+## Elevation providers, callables taking arrays of lats and lons and returning elevations in meters
+###
+
+
+class RasterElevation:
+    """Bilinear interpolation in a north-up grid of elevations covering north/south/east/west."""
+
+    def __init__(self, elevations, north, south, east, west):
+        self.elevations = np.asarray(elevations, dtype=np.float64)
+        self.north, self.south, self.east, self.west = north, south, east, west
+
+    @classmethod
+    def from_file(cls, path):
+        """An .npz with an 'elevation' grid and north/south/east/west, or a GeoTIFF if rasterio is installed."""
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                return cls(data['elevation'], float(data['north']), float(data['south']),
+                           float(data['east']), float(data['west']))
+        import rasterio
+
+        with rasterio.open(path) as raster:
+            bounds = raster.bounds
+            return cls(raster.read(1), bounds.top, bounds.bottom, bounds.right, bounds.left)
+
+    def __call__(self, lats, lons):
+        rows, cols = self.elevations.shape
+        # Pixel centres at (i + 0.5) / rows of the way down from north
+        y = np.clip((self.north - np.asarray(lats)) / (self.north - self.south) * rows - 0.5, 0, rows - 1)
+        x = np.clip((np.asarray(lons) - self.west) / (self.east - self.west) * cols - 0.5, 0, cols - 1)
+        y0 = np.minimum(y.astype(np.int64), max(rows - 2, 0))
+        x0 = np.minimum(x.astype(np.int64), max(cols - 2, 0))
+        y1, x1 = np.minimum(y0 + 1, rows - 1), np.minimum(x0 + 1, cols - 1)
+        dy, dx = y - y0, x - x0
+        grid = self.elevations
+        return (grid[y0, x0] * (1 - dy) * (1 - dx) + grid[y0, x1] * (1 - dy) * dx
+                + grid[y1, x0] * dy * (1 - dx) + grid[y1, x1] * dy * dx)
+
+
+class PointElevation:
+    """Elevation of the nearest of a set of surveyed points."""
+
+    def __init__(self, lats, lons, elevations, cell_size=0.005):
+        self.elevations = np.asarray(elevations, dtype=np.float64)
+        self.index = SpatialIndex(lats, lons, cell_size)
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        """A CSV with lat, lon and elevation columns."""
+        data = np.genfromtxt(path, delimiter=',', names=True)
+        return cls(data['lat'], data['lon'], data['elevation'], **kwargs)
+
+    def __call__(self, lats, lons):
+        return np.array([self.elevations[self.index.nearest(lat, lon)] for lat, lon in zip(lats, lons)])
+
+
+class GoogleElevation:
+    """The Google elevation API through osmnx, as in the notebook. Needs network access."""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def add_to(self, graph):
+        import osmnx as ox
+
+        return ox.add_node_elevations(graph, api_key=self.api_key)
+
+
+def add_elevations(graph, provider):
+    """Set node 'elevation' from provider and edge 'grade' / 'grade_abs' like ox.add_edge_grades."""
+    import networkx as nx
+
+    if hasattr(provider, 'add_to'):
+        graph = provider.add_to(graph)
+    else:
+        nodes = list(graph.nodes())
+        lats = np.array([graph.nodes[node]['y'] for node in nodes])
+        lons = np.array([graph.nodes[node]['x'] for node in nodes])
+        nx.set_node_attributes(graph, dict(zip(nodes, np.round(provider(lats, lons), 3).tolist())), 'elevation')
+
+    for u, v, data in graph.edges(data=True):
+        rise = graph.nodes[v]['elevation'] - graph.nodes[u]['elevation']
+        grade = round(rise / data['length'], 4) if data.get('length') else np.nan
+        data['grade'] = grade
+        data['grade_abs'] = abs(grade)
+    return graph
+
+
+###
+## The network as arrays
+###
+
+
+class RoadNetwork:
+    """A road graph with a spatial index over its nodes, saved to and loaded from .npz."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.nodes = list(graph.nodes())
+        self.index = SpatialIndex([graph.nodes[node]['y'] for node in self.nodes],
+                                  [graph.nodes[node]['x'] for node in self.nodes])
+
+    def save(self, path):
+        graph = self.graph
+        position = {node: i for i, node in enumerate(self.nodes)}
+        edges = list(graph.edges(keys=True, data=True))
+        arrays = {
+            'nodes': np.asarray(self.nodes),
+            'edge_u': np.array([position[u] for u, _, _, _ in edges], dtype=np.int64),
+            'edge_v': np.array([position[v] for _, v, _, _ in edges], dtype=np.int64),
+            'edge_key': np.array([key for _, _, key, _ in edges], dtype=np.int64),
+            'graph': np.array(json.dumps({key: value for key, value in graph.graph.items()
+                                          if isinstance(value, (str, int, float, bool))})),
+        }
+        for attr in NODE_ATTRS:
+            arrays['node_' + attr] = np.array([graph.nodes[node].get(attr, np.nan) for node in self.nodes],
+                                              dtype=np.float64)
+        for attr in EDGE_ATTRS:
+            arrays['edge_' + attr] = np.array([data.get(attr, np.nan) for _, _, _, data in edges], dtype=np.float64)
+
+        # Write next to the target then rename, so an interrupted save leaves the old file intact
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        import networkx as nx
+
+        with np.load(path) as data:
+            graph = nx.MultiDiGraph(**json.loads(str(data['graph'])))
+            nodes = data['nodes'].tolist()
+            node_attrs = {attr: data['node_' + attr].tolist() for attr in NODE_ATTRS}
+            for i, node in enumerate(nodes):
+                graph.add_node(node, **{attr: values[i] for attr, values in node_attrs.items()
+                                        if values[i] == values[i]})
+            edge_attrs = {attr: data['edge_' + attr].tolist() for attr in EDGE_ATTRS}
+            for i, (u, v, key) in enumerate(zip(data['edge_u'].tolist(), data['edge_v'].tolist(),
+                                                data['edge_key'].tolist())):
+                graph.add_edge(nodes[u], nodes[v], key=key,
+                               **{attr: values[i] for attr, values in edge_attrs.items() if values[i] == values[i]})
+        return cls(graph)
+
+    def bbox_subgraph(self, north, south, east, west, retain_all=False):
+        """The nodes inside the box and the edges between them, like ox.truncate_graph_bbox.
+
+        Unless retain_all, only the largest weakly connected piece is kept, as osmnx does."""
+        import networkx as nx
+
+        subgraph = self.graph.subgraph([self.nodes[i] for i in self.index.in_bbox(north, south, east, west)]).copy()
+        if not retain_all and len(subgraph):
+            subgraph = subgraph.subgraph(max(nx.weakly_connected_components(subgraph), key=len)).copy()
+        return subgraph
+
+
+def load_road_network(place, path, network_type='drive', elevation=None):
+    """The RoadNetwork saved at path, downloading `place` and saving it there first if needed.
+
+    elevation is a provider used on first download, e.g. RasterElevation,
+    PointElevation or GoogleElevation. Without one the nodes get no elevation."""
+    if os.path.exists(path):
+        return RoadNetwork.load(path)
+
+    import osmnx as ox
+
+    graph = ox.graph_from_place(place, network_type=network_type)
+    if elevation is not None:
+        graph = add_elevations(graph, elevation)
+    network = RoadNetwork(graph)
+    network.save(path)
+    return network